@@ -1,32 +1,37 @@
 # ----------------------------
 # Prepare training data from Metadata file-----准备训练数据
 # ----------------------------
+import os
 import pandas as pd
 from pathlib import Path
-# 定义数据集的下载路径
-download_path= Path.cwd()/'UrbanSound8K/UrbanSound8K'
+# 定义数据集的下载路径（可通过环境变量US8K_PATH指向其他位置，如合成的测试数据集）
+download_path= Path(os.environ.get('US8K_PATH', Path.cwd()/'UrbanSound8K/UrbanSound8K'))
 
 # 读取元数据文件
 metadata_file = download_path/'metadata'/'UrbanSound8K.csv'
-# 将元数据文件加载到DataFrame中
-df = pd.read_csv(metadata_file)
-# 预览DataFrame的前5行
-df.head()
-#print(df.head())
+# 只做推理（如classify.py批量分类新录音）时可以没有数据集，此时df为None
+df = None
+if metadata_file.exists():
+  # 将元数据文件加载到DataFrame中
+  df = pd.read_csv(metadata_file)
+  # 预览DataFrame的前5行
+  df.head()
+  #print(df.head())
 
-# 通过拼接'fold'和'slice_file_name'列来形成文件的相对路径
-df['relative_path'] = '/fold' + df['fold'].astype(str) + '/' + df['slice_file_name'].astype(str)
+  # 通过拼接'fold'和'slice_file_name'列来形成文件的相对路径
+  df['relative_path'] = '/fold' + df['fold'].astype(str) + '/' + df['slice_file_name'].astype(str)
 
-# 只保留'relative_path'和'classID'这两列
-df = df[['relative_path', 'classID']]
-# 预览处理后的DataFrame的前5行
-df.head()
-#print(df.head())
+  # 只保留'relative_path'和'classID'这两列
+  df = df[['relative_path', 'classID']]
+  # 预览处理后的DataFrame的前5行
+  df.head()
+  #print(df.head())
 
 
 #从文件中读取音频
 
 import math,random
+import numpy as np
 import torch
 import torchaudio
 from torchaudio import transforms
@@ -57,6 +62,26 @@ class AudioUtil():
       sig, sr = torchaudio.load(audio_file)
       return (sig, sr)
 
+#样本级随机数生成器——由(全局种子, epoch, 样本索引)确定，保证增强可复现且各worker互不重复
+  def make_generator(seed, epoch, idx):
+      """
+      为单个样本创建确定性的随机数生成器。
+
+      通过numpy的SeedSequence将(全局种子, epoch, 样本索引)混合为一个种子，
+      因此同一样本在同一epoch中的增强结果与DataLoader的worker数量和调度顺序无关，
+      可以精确重放，也可以提前在后台预计算并缓存。
+
+      参数:
+      seed: int - 全局随机种子。
+      epoch: int - 当前训练轮次。
+      idx: int - 样本在数据集中的索引。
+
+      返回值:
+      torch.Generator - 已设置种子的随机数生成器。
+      """
+      state = np.random.SeedSequence([int(seed), int(epoch), int(idx)]).generate_state(1, dtype=np.uint64)[0]
+      return torch.Generator().manual_seed(int(state) & 0x7FFFFFFFFFFFFFFF)
+
 
 #转换为两个通道--我们将通过将第一个声道复制到第二个声道将单声道文件转换为立体声。
   def rechannel(aud, new_channel):
@@ -97,7 +122,7 @@ class AudioUtil():
 
   #调整大小到相同的长度
 
-  def pad_trunc(aud, max_ms):
+  def pad_trunc(aud, max_ms, generator=None):
     sig, sr = aud
     num_rows, sig_len = sig.shape
     max_len = sr // 1000 * max_ms
@@ -108,7 +133,7 @@ class AudioUtil():
 
     elif (sig_len < max_len):
       # Length of padding to add at the beginning and end of the signal
-      pad_begin_len = random.randint(0, max_len - sig_len)
+      pad_begin_len = int(torch.randint(0, max_len - sig_len + 1, (1,), generator=generator))
       pad_end_len = max_len - sig_len - pad_begin_len
 
       # Pad with 0s
@@ -119,10 +144,10 @@ class AudioUtil():
 
     return (sig, sr)
 #时移
-  def time_shift(aud, shift_limit):
+  def time_shift(aud, shift_limit, generator=None):
     sig, sr = aud
     _, sig_len = sig.shape
-    shift_amt = int(random.random() * shift_limit * sig_len)
+    shift_amt = int(float(torch.rand(1, generator=generator)) * shift_limit * sig_len)
     return (sig.roll(shift_amt), sr)
 
 #梅尔光谱图
@@ -138,17 +163,33 @@ class AudioUtil():
     return (spec)
 
 #数据增强——时间和频率屏蔽
-  def spectro_augment(spec, max_mask_pct=0.1, n_freq_masks=1, n_time_masks=1):
+  def mask_along_axis(spec, mask_param, mask_value, axis, generator=None, inplace=False):
+    # Same sampling as torchaudio's FrequencyMasking/TimeMasking (one mask shared
+    # by all channels), but drawn from the given generator so it can be replayed.
+    # With inplace=True the mask is written into spec instead of a copy
+    size = spec.shape[axis]
+    value = float(torch.rand(1, generator=generator)) * mask_param
+    min_value = float(torch.rand(1, generator=generator)) * (size - value)
+    mask_start, mask_end = int(min_value), int(min_value + value)
+
+    if (mask_end > mask_start):
+      if not inplace:
+        spec = spec.clone()
+      spec.narrow(axis, mask_start, mask_end - mask_start).fill_(mask_value)
+    return spec
+
+  # inplace=True masks spec itself (for freshly computed spectrograms that nobody else holds)
+  def spectro_augment(spec, max_mask_pct=0.1, n_freq_masks=1, n_time_masks=1, generator=None, inplace=False):
     _, n_mels, n_steps = spec.shape
     mask_value = spec.mean()
     aug_spec = spec
 
     freq_mask_param = max_mask_pct * n_mels
     for _ in range(n_freq_masks):
-      aug_spec = transforms.FrequencyMasking(freq_mask_param)(aug_spec, mask_value)
+      aug_spec = AudioUtil.mask_along_axis(aug_spec, freq_mask_param, mask_value, 1, generator, inplace)
 
     time_mask_param = max_mask_pct * n_steps
     for _ in range(n_time_masks):
-      aug_spec = transforms.TimeMasking(time_mask_param)(aug_spec, mask_value)
+      aug_spec = AudioUtil.mask_along_axis(aug_spec, time_mask_param, mask_value, 2, generator, inplace)
 
     return aug_spec
\ No newline at end of file
@@ -0,0 +1,298 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from chunk_store import STORE_FIELDS, ChunkStoreWriter, chunk_record
+from enhanced_markdown_splitter import (CHUNK_OVERLAP, CHUNK_OVERLAP_TOKENS, CHUNK_SIZE, CHUNK_TOKENS,
+                                        HEADERS_TO_SPLIT, MAX_CHUNK_LENGTH, MAX_CHUNK_TOKENS, TOKENIZE_BATCH_SIZE,
+                                        TOKENIZER_PATH, TokenCounter, batched, iter_mapped_sections,
+                                        iter_markdown_lines, make_splitter, split_sections, token_stats)
+
+# 配置参数
+INPUT_DIR = os.path.join(os.path.pardir, 'outputs')  # MinerU的输出目录，递归查找其中的.md文件
+OUTPUT_DIR = "split_markdown_docs"  # 每个文档的切片保存在以文档ID命名的子文件夹中
+MANIFEST_FILE = "manifest.csv"  # 全局切片清单，位于OUTPUT_DIR中
+DOC_STORE_FILE = "_chunks.jsonl"  # 每个文档子文件夹中的切片库（含章节哈希），供汇总和下次增量切分时比对
+CHANGES_FILE = "changes.csv"  # 本次运行新增/删除的切片和切分失败的文档，供下游问答生成只处理变化的部分
+STORE_FORMAT = "jsonl"  # 汇总切片库OUTPUT_DIR/chunks.<格式>的格式：jsonl或parquet（需要pyarrow），列与DOC_STORE_FIELDS相同
+MANIFEST_FIELDS = ["doc_id", "chunk_id", "file", "header_path", "char_start", "char_end", "length", "tokens",
+                   "section_hash", "section_start", "chunk_hash"]
+CHANGE_FIELDS = ["doc_id", "status", "file", "chunk_hash", "header_path"]
+INT_FIELDS = ["chunk_id", "char_start", "char_end", "length", "tokens", "section_start"]
+DOC_STORE_FIELDS = [*STORE_FIELDS, "section_hash", "section_start"]
+
+_token_counters = {}  # 每个工作进程按分词器路径缓存TokenCounter，分词器和token计数缓存在多个文档间复用
+
+def find_documents(input_dir):
+    """递归查找Markdown文档，返回按文档ID排序的(文档ID, 路径)列表，文档ID为去掉扩展名的相对路径"""
+    docs = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.endswith('.md'):
+                path = os.path.join(root, name)
+                doc_id = os.path.splitext(os.path.relpath(path, input_dir))[0].replace(os.sep, '/')
+                docs.append((doc_id, path))
+    return sorted(docs)
+
+def header_path(metadata):
+    """切片所在的标题路径，如"一级标题 > 二级标题" """
+    return " > ".join(metadata[name] for _, name in HEADERS_TO_SPLIT if metadata.get(name) is not None)
+
+def read_manifest(path):
+    """流式读取清单文件，逐行产出dict（数值列转换为int）"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            for field in INT_FIELDS:
+                if row.get(field):
+                    row[field] = int(row[field])
+            yield row
+
+def section_hash(section, max_length, tokenizer_path=None):
+    """章节的内容哈希，包含标题和切分参数（含分词器），参数变化时所有章节都会重新切分"""
+    headers = {k: v for k, v in section.metadata.items() if not k.startswith("char_")}
+    params = [max_length, CHUNK_SIZE, CHUNK_OVERLAP]
+    if tokenizer_path:
+        params = [max_length, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, tokenizer_path]
+    key = json.dumps([*params, headers, section.page_content], ensure_ascii=False)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def hashed_chunk_file_name(header1, digest, occurrence=1):
+    """以内容哈希命名切片（作为切片标识和导出.md时的文件名），章节增删时其余切片的名称不变
+
+    同一文档中内容相同的切片按出现顺序加序号（第2个起为_2、_3……），每个切片的名称在文档内唯一。
+    """
+    title = ("chunk" if header1 is None else header1).replace("/", "_")  # 处理非法字符
+    suffix = f"_{occurrence}" if occurrence > 1 else ""
+    return f"{title[:30]}_{digest}{suffix}.md"
+
+def get_token_counter(tokenizer_path):
+    if tokenizer_path not in _token_counters:
+        _token_counters[tokenizer_path] = TokenCounter(tokenizer_path)
+    return _token_counters[tokenizer_path]
+
+def previous_sections(doc_dir):
+    """读取文档上次的切片（不保留正文，只记录每条记录在文件中的偏移量），按章节哈希分组（同一哈希只保留第一次出现的章节）"""
+    sections, rows = {}, []
+    state_path = os.path.join(doc_dir, DOC_STORE_FILE)
+    if os.path.exists(state_path):
+        with open(state_path, 'rb') as f:
+            offset = 0
+            for line in f:
+                row = json.loads(line)
+                del row["text"]
+                row["offset"] = offset
+                offset += len(line)
+                rows.append(row)
+    for row in rows:
+        key = row.get("section_hash")
+        if not key:
+            continue
+        group = sections.setdefault(key, [])
+        if not group or group[0]["section_start"] == row["section_start"]:
+            group.append(row)
+    return sections, rows
+
+def split_document(doc_id, path, output_dir=OUTPUT_DIR, max_length=None, tokenizer_path=None, export_md=False):
+    """在工作进程中增量切分一个文档：内容未变的章节沿用上次的切片，只对变化的章节重新切分
+
+    文档的切片流式写入其子文件夹中的切片库DOC_STORE_FILE，export_md时另外把每个切片导出为一个.md文件。
+    给定tokenizer_path时按token数切分，需要重新切分的章节每TOKENIZE_BATCH_SIZE个批量分词一次。
+    返回:(清单行（不含正文）, 变更列表, 源文件字节数, 重新切分的章节数, 章节总数)
+    """
+    doc_dir = os.path.join(output_dir, doc_id)
+    os.makedirs(doc_dir, exist_ok=True)
+    state_path = os.path.join(doc_dir, DOC_STORE_FILE)
+    old_sections, old_rows = previous_sections(doc_dir)
+    counter = get_token_counter(tokenizer_path) if tokenizer_path else None
+    if max_length is None:
+        max_length = MAX_CHUNK_LENGTH if counter is None else MAX_CHUNK_TOKENS
+    splitter = make_splitter(counter)
+
+    rows, n_sections, n_resplit = [], 0, 0
+    occurrences = Counter()  # (一级标题, 内容哈希) -> 已出现次数，内容相同的切片按顺序编号
+
+    def add(record):
+        key = (record.get("Header 1"), record["chunk_hash"])
+        occurrences[key] += 1
+        record["file"] = f"{doc_id}/{hashed_chunk_file_name(*key, occurrences[key])}"
+        rows.append({**{k: v for k, v in record.items() if k != "text"}, "header_path": header_path(record)})
+        writer.write(record)
+        file_path = os.path.join(output_dir, record["file"])
+        if export_md and not os.path.exists(file_path):
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(record["text"])
+
+    # 先关闭旧切片库再替换
+    with ChunkStoreWriter(state_path, DOC_STORE_FIELDS) as writer, \
+            (open(state_path, 'rb') if old_rows else nullcontext()) as old_store:
+        sections = iter_mapped_sections(iter_markdown_lines(path))
+        for batch in batched(sections, 1 if counter is None else TOKENIZE_BATCH_SIZE):
+            digests = [section_hash(section, max_length, tokenizer_path) for section, _ in batch]
+            changed = [i for i, digest in enumerate(digests) if digest not in old_sections]
+            resplit = dict(zip(changed, split_sections([batch[i] for i in changed], splitter, max_length, counter)))
+            n_sections += len(batch)
+            n_resplit += len(changed)
+            # 按章节顺序写出切片
+            for i, ((section, _), digest) in enumerate(zip(batch, digests)):
+                section_start = section.metadata["char_start"]
+                if i not in resplit:
+                    # 章节未变：从旧切片库中读出上次的切片，只按章节位置的变化平移字符范围
+                    for old in old_sections[digest]:
+                        old_store.seek(old["offset"])
+                        record = json.loads(old_store.readline())
+                        shift = section_start - old["section_start"]
+                        record.update(chunk_id=len(rows) + 1, char_start=old["char_start"] + shift,
+                                      char_end=old["char_end"] + shift, section_start=section_start)
+                        add(record)
+                    continue
+                for chunk in resplit[i]:
+                    record = chunk_record(chunk, doc_id, len(rows) + 1, None)
+                    record.update(section_hash=digest, section_start=section_start)
+                    add(record)
+
+    # 变更列表：切片以内容标识，内容变化的切片表现为删除旧切片并新增新切片
+    old_files = {row["file"]: row for row in old_rows}
+    new_files = {row["file"]: row for row in rows}
+    changes = [{"doc_id": doc_id, "status": "added", "file": f, "chunk_hash": row["chunk_hash"],
+                "header_path": row["header_path"]} for f, row in new_files.items() if f not in old_files]
+    changes += [{"doc_id": doc_id, "status": "removed", "file": f, "chunk_hash": row["chunk_hash"],
+                 "header_path": header_path(row)} for f, row in old_files.items() if f not in new_files]
+    # 删除不再导出或不再被引用的.md文件（包括旧版本逐个切片写出的文件）
+    for name in os.listdir(doc_dir):
+        if name.endswith('.md') and not (export_md and f"{doc_id}/{name}" in new_files):
+            os.remove(os.path.join(doc_dir, name))
+    return rows, changes, os.path.getsize(path), n_resplit, n_sections
+
+def previous_manifest_rows(output_dir, doc_id):
+    """上次全局清单中一个文档的切片行；该文档本次切分失败时原样沿用"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return []
+    return [row for row in read_manifest(manifest_path) if row["doc_id"] == doc_id]
+
+def removed_documents(output_dir, doc_ids):
+    """流式扫描上次的全局清单，返回已不在输入目录中的文档的切片（作为删除的变更）并删除其切片库和导出的切片文件"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return []
+    changes, gone = [], set()
+    for row in read_manifest(manifest_path):
+        if row["doc_id"] in doc_ids:
+            continue
+        gone.add(row["doc_id"])
+        changes.append({"doc_id": row["doc_id"], "status": "removed", "file": row["file"],
+                        "chunk_hash": row.get("chunk_hash", ""), "header_path": row["header_path"]})
+        file_path = os.path.join(output_dir, row["file"])
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    for doc_id in gone:
+        state_path = os.path.join(output_dir, doc_id, DOC_STORE_FILE)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+    return changes
+
+def batch_split(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, workers=None, max_length=None, tokenizer_path=None,
+                store_format=STORE_FORMAT, export_md=False):
+    """用进程池并行增量切分目录中的全部文档，按文档顺序写入汇总切片库、全局清单和变更列表，返回吞吐量统计
+
+    切分失败的文档沿用上次的清单行和切片库（不会从下游消失），并在变更列表中记为failed。
+    按token数切分时统计信息中另外包含每个切片token数的分布（token_stats）。
+    """
+    docs = find_documents(input_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    changes_path = os.path.join(output_dir, CHANGES_FILE)
+    store_path = os.path.join(output_dir, f"chunks.{store_format}")
+    stats = {"documents": 0, "failed": 0, "chunks": 0, "carried_chunks": 0, "bytes": 0, "sections": 0,
+             "resplit_sections": 0, "added": 0, "removed": 0}
+    token_counts = []
+
+    start = time.perf_counter()
+    with open(f"{manifest_path}.tmp", 'w', encoding='utf-8', newline='') as f, \
+            open(f"{changes_path}.tmp", 'w', encoding='utf-8', newline='') as changes_file, \
+            ChunkStoreWriter(store_path, DOC_STORE_FIELDS) as store, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        change_writer = csv.DictWriter(changes_file, fieldnames=CHANGE_FIELDS)
+        change_writer.writeheader()
+        futures = [pool.submit(split_document, doc_id, path, output_dir, max_length, tokenizer_path, export_md)
+                   for doc_id, path in docs]
+        # 按提交顺序取结果，清单内容与进程数和完成顺序无关
+        for (doc_id, _), future in zip(docs, futures):
+            try:
+                rows, changes, size, n_resplit, n_sections = future.result()
+            except Exception as e:
+                print(f"切分失败 {doc_id}: {e}，沿用上次的切片")
+                stats["failed"] += 1
+                change_writer.writerow({"doc_id": doc_id, "status": "failed", "file": "", "chunk_hash": "",
+                                        "header_path": ""})
+                # 出错时文档的切片库不会被替换，仍是上次的版本
+                old_rows = previous_manifest_rows(output_dir, doc_id)
+                state_path = os.path.join(output_dir, doc_id, DOC_STORE_FILE)
+                if old_rows and os.path.exists(state_path):
+                    writer.writerows(old_rows)
+                    store.append_store(state_path)
+                    stats["carried_chunks"] += len(old_rows)
+                continue
+            writer.writerows(rows)
+            change_writer.writerows(changes)
+            store.append_store(os.path.join(output_dir, doc_id, DOC_STORE_FILE))
+            stats["documents"] += 1
+            stats["chunks"] += len(rows)
+            stats["bytes"] += size
+            stats["sections"] += n_sections
+            stats["resplit_sections"] += n_resplit
+            if tokenizer_path:
+                token_counts.extend(row["tokens"] for row in rows)
+            for change in changes:
+                stats[change["status"]] += 1
+        # 已从输入目录中删除的文档
+        for change in removed_documents(output_dir, {doc_id for doc_id, _ in docs}):
+            change_writer.writerow(change)
+            stats["removed"] += 1
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    os.replace(f"{changes_path}.tmp", changes_path)
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "seconds": elapsed,
+        "docs_per_s": stats["documents"] / elapsed,
+        "chunks_per_s": stats["chunks"] / elapsed,
+        "mb_per_s": stats["bytes"] / 2**20 / elapsed,
+    })
+    if token_counts:
+        stats["token_stats"] = token_stats(token_counts, max_length or MAX_CHUNK_TOKENS)
+    return stats
+
+# 批量处理流程
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="并行切分目录中的全部MinerU解析文档")
+    parser.add_argument("input_dir", nargs="?", default=INPUT_DIR)
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="切分进程数")
+    parser.add_argument("--max-length", type=int, default=None,
+                        help=f"二次切分阈值，默认{MAX_CHUNK_LENGTH}字符或{MAX_CHUNK_TOKENS}个token")
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH, help="目标LLM的分词器路径，给定时按token数切分")
+    parser.add_argument("--store-format", choices=["jsonl", "parquet"], default=STORE_FORMAT, help="汇总切片库的格式")
+    parser.add_argument("--export-md", action="store_true", help="另外把每个切片导出为文档子文件夹中的一个.md文件")
+    args = parser.parse_args()
+
+    stats = batch_split(args.input_dir, args.output, args.workers, args.max_length, args.tokenizer,
+                        args.store_format, args.export_md)
+    print(f"已切分 {stats['documents']} 个文档（失败 {stats['failed']} 个，沿用其上次的 {stats['carried_chunks']} 个切片），"
+          f"共 {stats['chunks']} 个切片，"
+          f"切片库：{os.path.join(args.output, f'chunks.{args.store_format}')}，"
+          f"清单：{os.path.join(args.output, MANIFEST_FILE)}")
+    print(f"重新切分 {stats['resplit_sections']}/{stats['sections']} 个章节，新增 {stats['added']} 个切片，"
+          f"删除 {stats['removed']} 个切片，变更列表：{os.path.join(args.output, CHANGES_FILE)}")
+    print(f"耗时 {stats['seconds']:.1f} 秒：{stats['docs_per_s']:.1f} 文档/秒，"
+          f"{stats['chunks_per_s']:.0f} 切片/秒，{stats['mb_per_s']:.2f} MB/秒")
+    if "token_stats" in stats:
+        print("\n每个切片的token数统计：")
+        print(stats["token_stats"])
@@ -0,0 +1,329 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import torch
+import torchaudio
+from torch.utils.data import Dataset
+
+# ----------------------------
+# Benchmark settings
+# ----------------------------
+SAMPLE_RATES = [8000, 22050, 44100, 48000]  # 合成音频的采样率
+DURATIONS_S = [1.0, 4.0, 6.0]  # 合成音频的时长（秒），覆盖需要填充和需要截断的情况
+CHANNELS = [1, 2]
+WORKER_COUNTS = [0, 1, 2, 4]  # SoundDS吞吐量测试的DataLoader worker数量
+BATCH_SIZES = [1, 16, 64]  # AudioClassifier前向/反向测试的批大小
+REPEAT = 20
+TOLERANCE = 0.2  # 与基线比较时允许的变慢比例
+MIN_COMPARE_MS = 0.1  # 基线耗时低于此值的条目不参与回归判断（微秒级的阶段主要是计时噪声）
+FEATURE_DTYPES = ['float32', 'float16', 'bfloat16']  # worker内存测试的样本数据类型
+MEMORY_BATCH_SIZE = 256
+
+
+# ----------------------------
+# Synthetic audio corpus in UrbanSound8K layout
+# ----------------------------
+def make_wav_corpus(root, num_files=64, seed=0):
+    """
+    在root下按UrbanSound8K的目录结构生成合成WAV文件和元数据CSV，采样率、声道数和时长
+    轮流取自SAMPLE_RATES、CHANNELS和DURATIONS_S。内容为带噪声的正弦波，无需联网或真实数据集。
+
+    参数:
+    - root: 数据集根目录（对应Classification.download_path）。
+    - num_files: 生成的文件数量。
+    - seed: 随机种子。
+
+    返回:
+    - list: 每个文件的(路径, 采样率, 声道数, 时长)。
+    """
+    root = Path(root)
+    (root/'metadata').mkdir(parents=True, exist_ok=True)
+    g = torch.Generator().manual_seed(seed)
+    rows, files = [], []
+    for i in range(num_files):
+        sr = SAMPLE_RATES[i % len(SAMPLE_RATES)]
+        channels = CHANNELS[(i // len(SAMPLE_RATES)) % len(CHANNELS)]
+        duration = DURATIONS_S[(i // (len(SAMPLE_RATES) * len(CHANNELS))) % len(DURATIONS_S)]
+        fold, class_id = i % 10 + 1, i % 10
+        name = f'{i}-{class_id}-0-0.wav'
+        (root/f'fold{fold}').mkdir(exist_ok=True)
+
+        t = torch.arange(int(sr * duration)) / sr
+        tone = torch.sin(2 * torch.pi * (200 + 50 * class_id) * t)
+        sig = 0.5 * tone + 0.05 * torch.randn((channels, len(t)), generator=g)
+        path = root/f'fold{fold}'/name
+        torchaudio.save(str(path), sig, sr)
+        rows.append({'slice_file_name': name, 'fsID': i, 'start': 0.0, 'end': duration, 'salience': 1,
+                     'fold': fold, 'classID': class_id, 'class': f'class_{class_id}'})
+        files.append((str(path), sr, channels, duration))
+    pd.DataFrame(rows).to_csv(root/'metadata'/'UrbanSound8K.csv', index=False)
+    return files
+
+
+def _time(fn, repeat=REPEAT, warmup=2):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': statistics.median(times), 'mean_ms': statistics.fmean(times), 'min_ms': min(times)}
+
+
+# ----------------------------
+# AudioUtil stages
+# ----------------------------
+def bench_stages(files, repeat=REPEAT):
+    """
+    分别计时AudioUtil的每个处理阶段（open、resample、rechannel、pad_trunc、time_shift、
+    spectro_gram、spectro_augment），每种采样率/声道数/时长组合各测一次。
+    """
+    from Classification import AudioUtil
+
+    results = {}
+    seen = set()
+    for path, sr, channels, duration in files:
+        if (sr, channels, duration) in seen:
+            continue
+        seen.add((sr, channels, duration))
+        tag = f'{sr}Hz_{channels}ch_{duration:g}s'
+
+        aud = AudioUtil.open(path)
+        reaud = AudioUtil.resample(aud, 44100)
+        rechan = AudioUtil.rechannel(reaud, 2)
+        dur_aud = AudioUtil.pad_trunc(rechan, 4000)
+        shift_aud = AudioUtil.time_shift(dur_aud, 0.4)
+        sgram = AudioUtil.spectro_gram(shift_aud, n_mels=64, n_fft=1024, hop_len=None)
+
+        results[f'stage/open/{tag}'] = _time(lambda: AudioUtil.open(path), repeat)
+        results[f'stage/resample/{tag}'] = _time(lambda: AudioUtil.resample(aud, 44100), repeat)
+        results[f'stage/rechannel/{tag}'] = _time(lambda: AudioUtil.rechannel(reaud, 2), repeat)
+        results[f'stage/pad_trunc/{tag}'] = _time(lambda: AudioUtil.pad_trunc(rechan, 4000), repeat)
+        results[f'stage/time_shift/{tag}'] = _time(lambda: AudioUtil.time_shift(dur_aud, 0.4), repeat)
+        results[f'stage/spectro_gram/{tag}'] = _time(
+            lambda: AudioUtil.spectro_gram(shift_aud, n_mels=64, n_fft=1024, hop_len=None), repeat)
+        results[f'stage/spectro_augment/{tag}'] = _time(
+            lambda: AudioUtil.spectro_augment(sgram, max_mask_pct=0.1, n_freq_masks=2, n_time_masks=2), repeat)
+    return results
+
+
+# ----------------------------
+# SoundDS.__getitem__ throughput
+# ----------------------------
+def bench_dataset(worker_counts=WORKER_COUNTS, epochs=2):
+    """
+    用不同的DataLoader worker数量遍历SoundDS，测量每秒产出的样本数。
+    """
+    from torch.utils.data import DataLoader
+    from dataset_us8k import myds
+
+    results = {}
+    for workers in worker_counts:
+        dl = DataLoader(myds, batch_size=16, shuffle=False, num_workers=workers)
+        times = []
+        for epoch in range(epochs):
+            myds.set_epoch(epoch)
+            start = time.perf_counter()
+            for _ in dl:
+                pass
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        results[f'dataset/getitem/workers{workers}'] = {'ms_per_sample': best * 1000 / len(myds),
+                                                        'samples_per_s': len(myds) / best}
+    return results
+
+
+# ----------------------------
+# Peak RSS of a DataLoader worker
+# ----------------------------
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+class _RSSProbe(Dataset):
+    # 包装数据集，随每个样本返回所在worker进程计算样本前后的峰值RSS
+    def __init__(self, ds):
+        self.ds = ds
+
+    def __len__(self):
+        return len(self.ds)
+
+    def __getitem__(self, idx):
+        before = _peak_rss_mb()
+        sgram, class_id = self.ds[idx]
+        return sgram, class_id, before, _peak_rss_mb()
+
+
+def bench_worker_memory(dtypes=FEATURE_DTYPES, batch_size=MEMORY_BATCH_SIZE, workers=2, batches_per_worker=4):
+    """
+    以不同的feature_dtype遍历带增强的SoundDS，测量每个DataLoader worker的峰值RSS（仅限Unix）。
+    worker用spawn方式启动，峰值不包含从主进程fork继承的内存；idle_rss_mb是worker处理第一个样本前的峰值
+    （解释器和torch本身），pipeline_mb是样本处理、组批和预取批次额外占用的内存。
+    """
+    from torch.utils.data import DataLoader, RandomSampler
+    from dataset_us8k import myds
+
+    results = {}
+    for name in dtypes:
+        ds = copy.copy(myds)
+        ds.feature_dtype = getattr(torch, name)
+        sampler = RandomSampler(ds, replacement=True, num_samples=batch_size * workers * batches_per_worker,
+                                generator=torch.Generator().manual_seed(0))
+        dl = DataLoader(_RSSProbe(ds), batch_size=batch_size, sampler=sampler, num_workers=workers,
+                        multiprocessing_context='spawn')
+        idle, peak = float('inf'), 0.0
+        start = time.perf_counter()
+        for sgrams, _, before, after in dl:
+            idle, peak = min(idle, before.min().item()), max(peak, after.max().item())
+        elapsed = time.perf_counter() - start
+        results[f'memory/worker/{name}/batch{batch_size}'] = {
+            'peak_rss_mb': peak, 'idle_rss_mb': idle, 'pipeline_mb': peak - idle,
+            'batch_mb': sgrams.element_size() * sgrams[0].numel() * batch_size / 2**20,
+            'ms_per_sample': elapsed * 1000 / len(sampler)}
+    return results
+
+
+# ----------------------------
+# AudioClassifier forward / backward
+# ----------------------------
+def bench_model(batch_sizes=BATCH_SIZES, repeat=REPEAT):
+    """
+    测量AudioClassifier在不同批大小下前向传播和前向+反向传播的耗时。
+    """
+    from model import AudioClassifier
+
+    model = AudioClassifier()
+    criterion = torch.nn.CrossEntropyLoss()
+    results = {}
+    for bs in batch_sizes:
+        inputs = torch.randn(bs, 2, 64, 344)
+        labels = torch.randint(0, 10, (bs,))
+
+        def forward():
+            with torch.no_grad():
+                model(inputs)
+
+        def forward_backward():
+            model.zero_grad()
+            criterion(model(inputs), labels).backward()
+
+        model.eval()
+        fwd = _time(forward, repeat)
+        model.train()
+        fwd_bwd = _time(forward_backward, repeat)
+        fwd['samples_per_s'] = bs * 1000 / fwd['median_ms']
+        fwd_bwd['samples_per_s'] = bs * 1000 / fwd_bwd['median_ms']
+        results[f'model/forward/batch{bs}'] = fwd
+        results[f'model/forward_backward/batch{bs}'] = fwd_bwd
+    return results
+
+
+# ----------------------------
+# Baseline comparison
+# ----------------------------
+def timing_ms(stats):
+    """
+    条目的耗时：重复计时的中位数（median_ms），或整轮遍历折算的每样本耗时（ms_per_sample）。
+    """
+    return stats['median_ms'] if 'median_ms' in stats else stats['ms_per_sample']
+
+
+def compare(results, baseline, tolerance=TOLERANCE, min_ms=MIN_COMPARE_MS):
+    """
+    将本次结果与基线比较，耗时比基线慢超过tolerance的条目视为回归；基线耗时低于min_ms的条目跳过。
+
+    返回:
+    - list: 回归条目的(名称, 基线ms, 本次ms, 变化比例)。
+    """
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        old, new = timing_ms(baseline[name]), timing_ms(stats)
+        if old < min_ms:
+            continue
+        change = new / old - 1
+        if change > tolerance:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)/'UrbanSound8K'/'UrbanSound8K'
+        files = make_wav_corpus(root, num_files=args.files)
+        # 让Classification从合成数据集读取元数据，必须在导入数据管线之前设置
+        os.environ['US8K_PATH'] = str(root)
+
+        results = {}
+        if 'stages' in args.suites:
+            results.update(bench_stages(files, args.repeat))
+        if 'dataset' in args.suites:
+            results.update(bench_dataset(args.workers))
+        if 'model' in args.suites:
+            results.update(bench_model(args.batch_sizes, args.repeat))
+        if 'memory' in args.suites:
+            results.update(bench_worker_memory(args.dtypes, args.memory_batch_size))
+
+    return {
+        'meta': {'python': platform.python_version(), 'torch': torch.__version__, 'platform': platform.platform(),
+                 'cpu_count': os.cpu_count(), 'threads': torch.get_num_threads(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the audio pipeline and AudioClassifier on synthetic audio')
+    parser.add_argument('--suites', nargs='+', default=['stages', 'dataset', 'model'],
+                        choices=['stages', 'dataset', 'model', 'memory'])
+    parser.add_argument('--files', type=int, default=64, help='number of synthetic WAV files')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--workers', type=int, nargs='+', default=WORKER_COUNTS)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BATCH_SIZES)
+    parser.add_argument('--dtypes', nargs='+', default=FEATURE_DTYPES, choices=FEATURE_DTYPES)
+    parser.add_argument('--memory-batch-size', type=int, default=MEMORY_BATCH_SIZE)
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=None, help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--min-compare-ms', type=float, default=MIN_COMPARE_MS,
+                        help='skip entries whose baseline time is below this')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    report = run(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in report['results'].items():
+        if 'peak_rss_mb' in stats:
+            print(f'{name:50s} peak {stats["peak_rss_mb"]:8.1f} MB  pipeline {stats["pipeline_mb"]:8.1f} MB  '
+                  f'batch {stats["batch_mb"]:6.1f} MB')
+        else:
+            print(f'{name:50s} {timing_ms(stats):10.3f} ms')
+    print(f'Results saved to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(report['results'], baseline, args.tolerance, args.min_compare_ms)
+        for name, old, new, change in regressions:
+            print(f'REGRESSION {name}: {old:.3f} ms -> {new:.3f} ms ({change:+.0%})')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.tolerance:.0%} against {args.baseline}')
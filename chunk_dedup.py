@@ -0,0 +1,165 @@
+import argparse
+import csv
+import os
+from collections import Counter
+from itertools import chain
+
+import numpy as np
+from chunk_store import CHUNK_STORE_PATH, STORE_FIELDS, ChunkStoreWriter, chunk_hash, iter_chunks
+
+# 配置参数
+SHINGLE_SIZE = 5  # 按字符k-gram计算相似度（中文没有空格分词，用字符级shingle）
+NUM_PERM = 128  # MinHash签名长度
+LSH_BANDS = 16  # LSH分段数，每段NUM_PERM // LSH_BANDS个值；两个切片至少有一段完全相同才会被比较
+SIMILARITY_THRESHOLD = 0.85  # 估计的Jaccard相似度不低于该值时视为近似重复
+SEED = 1  # MinHash哈希函数的随机种子，固定后签名可复现
+DEDUP_REPORT_FILE = "dedup_report.csv"  # 被去除的切片及其保留的代表切片
+REPORT_FIELDS = ["doc_id", "file", "chunk_hash", "representative", "similarity"]
+TOP_CLUSTERS = 10  # 汇总中列出的最大重复簇个数
+
+def shingle_hashes(text, k=SHINGLE_SIZE):
+    """文本中所有字符k-gram的64位滚动哈希（去重后），用numpy向量化计算；空文本返回一个固定的哈希值"""
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) == 0:
+        return np.zeros(1, dtype=np.uint64)  # 否则签名时对空数组取最小值会出错，所有空切片互为重复
+    k = max(1, min(k, len(codes)))
+    n = len(codes) - k + 1
+    hashes = np.zeros(max(n, 1), dtype=np.uint64)
+    for j in range(k):
+        hashes = hashes * np.uint64(1099511628211) + codes[j:j + n]
+    return np.unique(hashes)
+
+class MinHasher:
+    """MinHash签名：NUM_PERM个乘移位哈希函数下每个shingle集合的最小值"""
+    def __init__(self, num_perm=NUM_PERM, seed=SEED):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 2**64, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**64, num_perm, dtype=np.uint64)
+
+    def signature(self, text, k=SHINGLE_SIZE):
+        x = shingle_hashes(text, k)
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+class NearDuplicateIndex:
+    """LSH索引，只包含保留下来的代表切片：新切片与命中同一分段桶的代表切片逐一比较签名"""
+    def __init__(self, num_perm=NUM_PERM, bands=LSH_BANDS, threshold=SIMILARITY_THRESHOLD):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.threshold = threshold
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = []
+
+    def band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature, keys):
+        """返回(最相似的代表切片编号, 估计的相似度)，没有不低于阈值的代表切片时返回(None, 0.0)"""
+        candidates = sorted({idx for bucket, key in zip(self.buckets, keys) for idx in bucket.get(key, ())})
+        if not candidates:
+            return None, 0.0
+        sims = (np.stack([self.signatures[idx] for idx in candidates]) == signature).mean(axis=1)
+        best = int(sims.argmax())  # 相似度相同时取编号最小（最早保留）的代表切片
+        if sims[best] < self.threshold:
+            return None, 0.0
+        return candidates[best], float(sims[best])
+
+    def add(self, signature, keys):
+        idx = len(self.signatures)
+        self.signatures.append(signature)
+        for bucket, key in zip(self.buckets, keys):
+            bucket.setdefault(key, []).append(idx)
+        return idx
+
+def default_output_path(store_path):
+    base, ext = os.path.splitext(store_path)
+    return f"{base}_dedup{ext}"
+
+def dedup_chunks(store_path=CHUNK_STORE_PATH, output_path=None, report_path=None, threshold=SIMILARITY_THRESHOLD,
+                 num_perm=NUM_PERM, bands=LSH_BANDS, shingle_size=SHINGLE_SIZE):
+    """流式读取切片库，按顺序把每个切片与已保留的切片比较，近似重复的切片只保留第一次出现的那个
+
+    去重后的切片库写入output_path（格式与列同输入），被去除的切片及其代表切片写入report_path。
+    返回:统计信息（切片数、去除数、节省的字符数/token数以及最大的重复簇）
+    """
+    output_path = output_path or default_output_path(store_path)
+    report_path = report_path or os.path.join(os.path.dirname(output_path), DEDUP_REPORT_FILE)
+    hasher = MinHasher(num_perm)
+    index = NearDuplicateIndex(num_perm, bands, threshold)
+    exact = {}  # 内容哈希 -> 代表切片编号，完全相同的切片不再计算签名
+    representatives = []  # 代表切片编号 -> 代表切片的file
+    cluster_sizes = Counter()
+    stats = {"chunks": 0, "kept": 0, "exact_duplicates": 0, "near_duplicates": 0, "chars": 0, "chars_removed": 0,
+             "tokens": 0, "tokens_removed": 0}
+
+    records = iter_chunks(store_path)
+    first = next(records, None)
+    fields = list(first) if first is not None else STORE_FIELDS  # 与输入切片库的列相同
+    if first is not None:
+        records = chain([first], records)
+    with ChunkStoreWriter(output_path, fields) as writer, \
+            open(f"{report_path}.tmp", 'w', encoding='utf-8', newline='') as f:
+        report = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        report.writeheader()
+        for record in records:
+            text = record["text"]
+            digest = record.get("chunk_hash") or chunk_hash(text)
+            stats["chunks"] += 1
+            stats["chars"] += len(text)
+            stats["tokens"] += record.get("tokens") or 0
+            if digest in exact:
+                rep, sim = exact[digest], 1.0
+                stats["exact_duplicates"] += 1
+            else:
+                signature = hasher.signature(text, shingle_size)
+                keys = index.band_keys(signature)
+                rep, sim = index.query(signature, keys)
+                if rep is None:
+                    rep = index.add(signature, keys)
+                    representatives.append(record["file"])
+                    exact[digest] = rep
+                    cluster_sizes[rep] += 1
+                    stats["kept"] += 1
+                    writer.write(record)
+                    continue
+                exact[digest] = rep
+                stats["near_duplicates"] += 1
+            cluster_sizes[rep] += 1
+            stats["chars_removed"] += len(text)
+            stats["tokens_removed"] += record.get("tokens") or 0
+            report.writerow({"doc_id": record.get("doc_id"), "file": record["file"], "chunk_hash": digest,
+                             "representative": representatives[rep], "similarity": round(sim, 3)})
+    os.replace(f"{report_path}.tmp", report_path)
+
+    stats["removed"] = stats["chunks"] - stats["kept"]
+    stats["removed_pct"] = 100 * stats["removed"] / max(stats["chunks"], 1)
+    stats["chars_removed_pct"] = 100 * stats["chars_removed"] / max(stats["chars"], 1)
+    stats["top_clusters"] = [(representatives[rep], size) for rep, size in cluster_sizes.most_common(TOP_CLUSTERS)
+                             if size > 1]
+    return stats
+
+# 去重流程：切分之后、生成问答对之前运行
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="基于MinHash/LSH去除切片库中的近似重复切片")
+    parser.add_argument("store", nargs="?", default=CHUNK_STORE_PATH, help="切分得到的切片库（JSONL或Parquet）")
+    parser.add_argument("--output", default=None, help="去重后的切片库，默认在输入文件名后加_dedup")
+    parser.add_argument("--report", default=None, help=f"去重报告，默认与输出在同一目录的{DEDUP_REPORT_FILE}")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM)
+    parser.add_argument("--bands", type=int, default=LSH_BANDS)
+    parser.add_argument("--shingle-size", type=int, default=SHINGLE_SIZE)
+    args = parser.parse_args()
+
+    output_path = args.output or default_output_path(args.store)
+    stats = dedup_chunks(args.store, output_path, args.report, args.threshold, args.num_perm, args.bands,
+                         args.shingle_size)
+    print(f"共 {stats['chunks']} 个切片，保留 {stats['kept']} 个，去除 {stats['removed']} 个"
+          f"（完全重复 {stats['exact_duplicates']}，近似重复 {stats['near_duplicates']}），去重后的切片库：{output_path}")
+    print(f"节省的问答生成工作量：{stats['removed']} 次LLM请求（{stats['removed_pct']:.1f}%），"
+          f"{stats['chars_removed']} 个字符（{stats['chars_removed_pct']:.1f}%）"
+          + (f"，{stats['tokens_removed']} 个输入token" if stats["tokens"] else ""))
+    if stats["top_clusters"]:
+        print("\n最大的重复簇（代表切片: 簇大小）：")
+        for file, size in stats["top_clusters"]:
+            print(f"  {file}: {size}")
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import shutil
+
+from enhanced_markdown_splitter import HEADERS_TO_SPLIT, OUTPUT_DIR, chunk_file_name
+
+# 配置参数
+CHUNK_STORE_PATH = os.path.join(OUTPUT_DIR, "chunks.jsonl")  # 切片库路径，扩展名为.parquet时写成Parquet
+WRITE_BATCH_SIZE = 10_000  # 每批写出的切片数（Parquet中为一个row group）
+READ_BATCH_SIZE = 10_000  # 流式读取Parquet时每批读取的行数
+# 切片库的列：所属文档、序号、导出.md时的相对路径、各级标题、在源文件中的字符范围、长度、token数、内容哈希和正文
+STORE_FIELDS = ["doc_id", "chunk_id", "file", *(name for _, name in HEADERS_TO_SPLIT), "char_start", "char_end",
+                "length", "tokens", "chunk_hash", "text"]
+INT_FIELDS = {"chunk_id", "char_start", "char_end", "length", "tokens", "section_start"}
+
+def chunk_hash(text):
+    """切片正文的内容哈希"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def chunk_record(doc, doc_id, chunk_id, file):
+    """把切片（Document）转换为切片库中的一条记录"""
+    record = {"doc_id": doc_id, "chunk_id": chunk_id, "file": file}
+    record.update({name: doc.metadata.get(name) for _, name in HEADERS_TO_SPLIT})
+    record.update({
+        "char_start": doc.metadata.get("char_start"),
+        "char_end": doc.metadata.get("char_end"),
+        "length": len(doc.page_content),
+        "tokens": doc.metadata.get("tokens"),
+        "chunk_hash": chunk_hash(doc.page_content),
+        "text": doc.page_content,
+    })
+    return record
+
+def store_format(path):
+    return "parquet" if path.endswith(".parquet") else "jsonl"
+
+class ChunkStoreWriter:
+    """批量写出切片记录：先写临时文件，close时替换目标文件，中断时不会留下不完整的切片库
+
+    JSONL每WRITE_BATCH_SIZE条记录写出一次；Parquet（需要pyarrow）每批写成一个row group。
+    fields为写出的列，记录中多余的键被忽略，缺少的键写为空值。
+    """
+    def __init__(self, path, fields=STORE_FIELDS, batch_size=WRITE_BATCH_SIZE):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.fields = fields
+        self.batch_size = batch_size
+        self.format = store_format(path)
+        self.pending = []
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self.schema = pa.schema([(name, pa.int64() if name in INT_FIELDS else pa.string()) for name in fields])
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+        else:
+            self.writer = open(self.tmp_path, 'w', encoding='utf-8')
+
+    def write(self, record):
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.format == "parquet":
+            import pyarrow as pa
+            columns = {name: [record.get(name) for record in self.pending] for name in self.fields}
+            self.writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+        else:
+            self.writer.writelines(json.dumps({name: record.get(name) for name in self.fields}, ensure_ascii=False)
+                                   + "\n" for record in self.pending)
+        self.pending = []
+
+    def append_store(self, path):
+        """追加另一个以相同列写出的切片库；两者都是JSONL时直接复制内容，不重新解析"""
+        if self.format == "jsonl" and store_format(path) == "jsonl":
+            self.flush()
+            with open(path, 'r', encoding='utf-8') as f:
+                shutil.copyfileobj(f, self.writer)
+        else:
+            self.write_all(iter_chunks(path))
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.writer.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def iter_chunks(path=CHUNK_STORE_PATH, batch_size=READ_BATCH_SIZE):
+    """流式读取切片库，逐条产出记录（dict），内存占用与切片库大小无关"""
+    if store_format(path) == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def write_chunks(chunks, path=CHUNK_STORE_PATH, doc_id=""):
+    """把一个文档的切片（可以是生成器）写入切片库，返回各切片的长度和token数（按字符数切分时为空）"""
+    lengths, token_counts = [], []
+    with ChunkStoreWriter(path) as writer:
+        for idx, doc in enumerate(chunks, 1):
+            writer.write(chunk_record(doc, doc_id, idx, chunk_file_name(idx, doc)))
+            lengths.append(len(doc.page_content))
+            if "tokens" in doc.metadata:
+                token_counts.append(doc.metadata["tokens"])
+    return lengths, token_counts
+
+def export_markdown(path=CHUNK_STORE_PATH, output_dir=OUTPUT_DIR):
+    """可选导出：把切片库中的每个切片写成output_dir下的一个.md文件（路径为记录中的file），返回导出的文件数"""
+    count = 0
+    for record in iter_chunks(path):
+        file_path = os.path.join(output_dir, record["file"])
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(record["text"])
+        count += 1
+    return count
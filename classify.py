@@ -0,0 +1,208 @@
+import argparse
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, Dataset
+from Classification import AudioUtil
+from event_detection import CLASS_NAMES
+from model import device, load_classifier, normalize_inputs
+
+# 与SoundDS相同的预处理参数
+SR = 44100
+CHANNEL = 2
+DURATION = 4000
+N_MELS = 64
+N_FFT = 1024
+HOP_LEN = None
+AUDIO_EXTENSIONS = {'.wav', '.flac', '.ogg', '.mp3'}
+BATCH_SIZE = 64
+FLUSH_EVERY = 1000  # 每写出多少行结果落盘一次
+COLUMNS = ['path', 'classID', 'class', 'confidence', 'error']
+
+
+# ----------------------------
+# Input listing
+# ----------------------------
+def list_inputs(source):
+    """
+    列出要分类的音频文件：source可以是文件夹（递归查找音频文件），也可以是清单文件——
+    带'path'列的CSV（没有则取第一列），或每行一个路径的文本文件。清单中的相对路径相对于清单所在目录。
+
+    返回:
+    - list: 按确定顺序排列的路径字符串（同时作为结果中的'path'列和续跑时的键）。
+    """
+    source = Path(source)
+    if source.is_dir():
+        return sorted(str(p) for p in source.rglob('*') if p.suffix.lower() in AUDIO_EXTENSIONS)
+    if source.suffix.lower() == '.csv':
+        manifest = pd.read_csv(source)
+        paths = manifest['path' if 'path' in manifest.columns else manifest.columns[0]].astype(str).tolist()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            paths = [line.strip() for line in f if line.strip()]
+    return [p if Path(p).is_absolute() else str(source.parent/p) for p in paths]
+
+
+class ClipDS(Dataset):
+    """
+    ClipDS在DataLoader的工作进程中解码音频并计算梅尔频谱图（AudioUtil处理链，不做增强）。
+    无法解码的文件返回全零频谱图和错误信息，不会中断整批任务。多于CHANNEL个声道的文件只保留前CHANNEL个声道
+    （与AudioUtil.rechannel把立体声转为单声道时取第一个声道一致）。
+
+    参数:
+    - paths: 音频文件路径列表。
+    """
+    def __init__(self, paths):
+        self.paths = paths
+        blank = AudioUtil.pad_trunc((torch.zeros(CHANNEL, 1), SR), DURATION, generator=torch.Generator().manual_seed(0))
+        self.blank = AudioUtil.spectro_gram(blank, n_mels=N_MELS, n_fft=N_FFT, hop_len=HOP_LEN)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        try:
+            aud = AudioUtil.open(self.paths[idx])
+            sig, sr = AudioUtil.resample(aud, SR)
+            # rechannel只处理单声道和立体声之间的转换
+            rechan = AudioUtil.rechannel((sig[:CHANNEL], sr), CHANNEL)
+            # 固定的生成器使短音频的填充位置可复现
+            dur_aud = AudioUtil.pad_trunc(rechan, DURATION, generator=torch.Generator().manual_seed(0))
+            sgram = AudioUtil.spectro_gram(dur_aud, n_mels=N_MELS, n_fft=N_FFT, hop_len=HOP_LEN)
+            # 形状不一致的样本会使组批失败并中断整批任务，在这里作为该文件的错误处理
+            if sgram.shape != self.blank.shape:
+                raise ValueError(f'unexpected spectrogram shape {tuple(sgram.shape)}')
+            return sgram, idx, ''
+        except Exception as e:
+            return self.blank, idx, f'{type(e).__name__}: {e}'
+
+
+# ----------------------------
+# Streaming, resumable output
+# ----------------------------
+class ResultWriter():
+    """
+    ResultWriter把分类结果流式写出并定期落盘，中断后重新运行会跳过已写出的文件。
+    CSV追加到同一个文件；Parquet文件关闭后无法追加，因此写成output目录下的part-xxxxx.parquet分片。
+
+    参数:
+    - output: 结果文件（CSV）或目录（Parquet）。
+    - fmt: 'csv'或'parquet'。
+    """
+    def __init__(self, output, fmt='csv'):
+        self.output = Path(output)
+        self.fmt = fmt
+        self.pending = []
+        if fmt == 'parquet':
+            self.output.mkdir(parents=True, exist_ok=True)
+            self.parts = len(list(self.output.glob('part-*.parquet')))
+        elif self.output.exists():
+            self._drop_partial_line()
+
+    def _drop_partial_line(self):
+        # 进程在写一行的中途被杀死时，截掉最后不完整的一行
+        with open(self.output, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def completed(self):
+        """
+        返回:
+        - set: 已经写出结果的路径（包括解码失败的文件）。
+        """
+        if self.fmt == 'parquet':
+            parts = sorted(self.output.glob('part-*.parquet'))
+            return set().union(*(pd.read_parquet(p, columns=['path'])['path'] for p in parts))
+        if not self.output.exists() or self.output.stat().st_size == 0:
+            return set()
+        return set(pd.read_csv(self.output, usecols=['path'])['path'].astype(str))
+
+    def write(self, rows):
+        self.pending.extend(rows)
+
+    def flush(self):
+        if not self.pending:
+            return
+        table = pd.DataFrame(self.pending, columns=COLUMNS)
+        if self.fmt == 'parquet':
+            path = self.output/f'part-{self.parts:05d}.parquet'
+            tmp_path = path.with_suffix('.tmp')
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            self.parts += 1
+        else:
+            header = not self.output.exists() or self.output.stat().st_size == 0
+            with open(self.output, 'a', encoding='utf-8', newline='') as f:
+                table.to_csv(f, header=header, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+        self.pending = []
+
+
+# ----------------------------
+# Batched inference
+# ----------------------------
+def classify(model, paths, writer, batch_size=BATCH_SIZE, num_workers=0, flush_every=FLUSH_EVERY):
+    """
+    在num_workers个进程中解码音频，按批做推理，结果通过writer流式写出。
+
+    参数:
+    - model: 训练好的AudioClassifier。
+    - paths: 待分类的路径（已跳过续跑前完成的部分）。
+    - writer: ResultWriter。
+
+    返回:
+    - int: 本次处理的文件数。
+    """
+    dl = DataLoader(ClipDS(paths), batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    done = unflushed = 0
+    start = time.monotonic()
+    with torch.no_grad():
+        for inputs, idx, errors in dl:
+            ok = torch.tensor([not e for e in errors])
+            probs = torch.zeros(len(idx), len(CLASS_NAMES))
+            if ok.any():
+                # 逐样本标准化，结果与分批方式和续跑位置无关
+                probs[ok] = torch.softmax(model(normalize_inputs(inputs[ok].to(device))), dim=1).cpu()
+            conf, pred = probs.max(dim=1)
+            writer.write([{'path': paths[i], 'classID': int(c) if e == '' else -1,
+                           'class': CLASS_NAMES[c] if e == '' else '', 'confidence': float(p) if e == '' else None,
+                           'error': e} for i, c, p, e in zip(idx.tolist(), pred.tolist(), conf.tolist(), errors)])
+            done += len(idx)
+            unflushed += len(idx)
+            if unflushed >= flush_every:
+                writer.flush()
+                unflushed = 0
+                print(f'{done}/{len(paths)} files, {done / (time.monotonic() - start):.1f} files/s')
+    writer.flush()
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Classify every audio file of a folder or manifest with AudioClassifier')
+    parser.add_argument('source', help='folder of audio files, CSV manifest with a path column, or text file of paths')
+    parser.add_argument('--checkpoint', default='best_model.pt', help='AudioClassifier weights or pruned checkpoint')
+    parser.add_argument('--output', default='classify_results.csv', help='CSV file, or directory for --format parquet')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None, help='default: from the output suffix')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='decoding processes')
+    parser.add_argument('--flush-every', type=int, default=FLUSH_EVERY)
+    args = parser.parse_args()
+
+    fmt = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    writer = ResultWriter(args.output, fmt)
+    paths = list_inputs(args.source)
+    completed = writer.completed()
+    todo = [p for p in paths if p not in completed]
+    if completed:
+        print(f'Resuming: {len(paths) - len(todo)} of {len(paths)} files already classified')
+
+    model = load_classifier(args.checkpoint)
+    start = time.monotonic()
+    n = classify(model, todo, writer, args.batch_size, args.workers, args.flush_every)
+    elapsed = time.monotonic() - start
+    print(f'Classified {n} files in {elapsed:.1f} s ({n / max(elapsed, 1e-9):.1f} files/s), results in {args.output}')
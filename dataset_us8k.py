@@ -1,4 +1,5 @@
 from torch.utils.data import DataLoader, Dataset, random_split
+from pathlib import Path
 import torch
 from Classification import df
 from Classification import download_path
@@ -15,6 +16,10 @@ class SoundDS(Dataset):
     参数:
     - df: 包含音频文件信息的DataFrame，如文件路径和类别ID。
     - data_path: 音频文件的根目录路径。
+    - seed: 全局随机种子。为None时沿用全局随机数状态；否则每个样本的增强由
+      (seed, epoch, idx)确定，与worker数量无关，可精确重放。
+    - feature_dtype: 输出声谱图的数据类型。torch.float16/torch.bfloat16使样本、批次、预取缓冲区和
+      特征缓存的内存减半，模型在输入处再转换回float32。
 
     属性:
     - df: 存储DataFrame的副本。
@@ -23,14 +28,41 @@ class SoundDS(Dataset):
     - sr: 音频的采样率。
     - channel: 音频的声道数。
     - shift_pct: 音频时间移位的百分比。
+    - n_mels, n_fft, hop_len: 梅尔频谱图的参数。
+    - max_mask_pct, n_freq_masks, n_time_masks: 频谱图屏蔽增强的参数。
+    - augment: 是否进行时间移位和屏蔽增强；为False时输出确定的原始频谱图（用于验证和特征缓存）。
+    - feature_dtype: 输出声谱图的数据类型。
+    - epoch: 当前训练轮次，通过set_epoch在每个epoch开始前更新。
     """
-    def __init__(self, df, data_path):
+    def __init__(self, df, data_path, seed=None, feature_dtype=torch.float32):
         self.df = df
         self.data_path = str(data_path)
         self.duration = 4000
         self.sr = 44100
         self.channel = 2
         self.shift_pct = 0.4
+        self.n_mels = 64
+        self.n_fft = 1024
+        self.hop_len = None
+        self.max_mask_pct = 0.1
+        self.n_freq_masks = 2
+        self.n_time_masks = 2
+        self.augment = True
+        self.seed = seed
+        self.feature_dtype = feature_dtype
+        self.epoch = 0
+
+    # ----------------------------
+    # Select the augmentation epoch
+    # ----------------------------
+    def set_epoch(self, epoch):
+        """
+        设置当前epoch，使下一轮的增强随机数由新的epoch派生。
+
+        参数:
+        - epoch: 训练轮次。
+        """
+        self.epoch = epoch
 
     # ----------------------------
     # Number of items in dataset
@@ -56,6 +88,26 @@ class SoundDS(Dataset):
         返回:
         - tuple: 包含增强后的声谱图和对应的类ID。
         """
+        return self.get_item(idx, self.epoch)
+
+    # ----------------------------
+    # Get i'th item for a given epoch
+    # ----------------------------
+    def get_item(self, idx, epoch):
+        """
+        获取指定epoch下的一个样本。设置了seed时结果只取决于(seed, epoch, idx)，
+        因此可以在任意进程中提前计算某个epoch的增强样本。
+
+        参数:
+        - idx: 样本的索引。
+        - epoch: 训练轮次。
+
+        返回:
+        - tuple: 包含增强后的声谱图和对应的类ID。
+        """
+        # 样本级随机数生成器，None表示使用全局随机数状态
+        gen = None if self.seed is None else AudioUtil.make_generator(self.seed, epoch, idx)
+
         # 根据索引获取音频文件的相对路径和类别ID
         # Absolute file path of the audio file - concatenate the audio directory with
         # the relative path
@@ -76,31 +128,72 @@ class SoundDS(Dataset):
         rechan = AudioUtil.rechannel(reaud, self.channel)
 
         # 将音频裁剪或填充到目标持续时间
-        dur_aud = AudioUtil.pad_trunc(rechan, self.duration)
+        dur_aud = AudioUtil.pad_trunc(rechan, self.duration, generator=gen)
+        if not self.augment:
+            sgram = AudioUtil.spectro_gram(dur_aud, n_mels=self.n_mels, n_fft=self.n_fft, hop_len=self.hop_len)
+            return sgram.to(self.feature_dtype, copy=True), class_id
+
         # 对音频进行时间移位
-        shift_aud = AudioUtil.time_shift(dur_aud, self.shift_pct)
+        shift_aud = AudioUtil.time_shift(dur_aud, self.shift_pct, generator=gen)
         # 计算梅尔频谱图
-        sgram = AudioUtil.spectro_gram(shift_aud, n_mels=64, n_fft=1024, hop_len=None)
-        # 对频谱图进行数据增强
-        aug_sgram = AudioUtil.spectro_augment(sgram, max_mask_pct=0.1, n_freq_masks=2, n_time_masks=2)
+        sgram = AudioUtil.spectro_gram(shift_aud, n_mels=self.n_mels, n_fft=self.n_fft, hop_len=self.hop_len)
+        # 对频谱图进行数据增强（sgram是刚计算出来的，直接原地屏蔽，不再复制）
+        aug_sgram = AudioUtil.spectro_augment(sgram, max_mask_pct=self.max_mask_pct, n_freq_masks=self.n_freq_masks,
+                                              n_time_masks=self.n_time_masks, generator=gen, inplace=True)
 
-        return aug_sgram, class_id
+        # 返回一个新分配的副本：频谱图本身分配于STFT等大块中间结果之前，若直接返回，
+        # 组批前暂存的样本会钉住这些已释放的内存碎片，使worker的峰值RSS反而升高
+        return aug_sgram.to(self.feature_dtype, copy=True), class_id
 
 from torch.utils.data import random_split
+if df is None:
+    raise FileNotFoundError(f'UrbanSound8K metadata not found: {download_path/"metadata"/"UrbanSound8K.csv"} '
+                            '(set US8K_PATH to the dataset root)')
 data_path=download_path
-myds = SoundDS(df, data_path)
+# 特征缓存目录（未增强的梅尔频谱图，见feature_cache.py）
+FEATURE_CACHE_DIR = Path.cwd()/'feature_cache'
+# 全局随机种子：决定训练/验证划分以及每个样本每个epoch的增强
+SEED = 42
+# 样本在内存中的数据类型：torch.float32，或用torch.float16/torch.bfloat16减半DataLoader worker、
+# 预取缓冲区和特征缓存的内存（在模型输入处再转换回float32）
+FEATURE_DTYPE = torch.float32
+myds = SoundDS(df, data_path, seed=SEED, feature_dtype=FEATURE_DTYPE)
 
 # Random split of 80:20 between training and validation
 num_items = len(myds)
 num_train = round(num_items * 0.8)
 num_val = num_items - num_train
-train_ds, val_ds = random_split(myds, [num_train, num_val])
+train_ds, val_ds = random_split(myds, [num_train, num_val], generator=torch.Generator().manual_seed(SEED))
 
 # Create training and validation data loaders
 
 # 使用PyTorch的数据加载器（DataLoader）来组织训练数据集
 # 参数batch_size指定每个训练批次的样本数量，shuffle为True表示在每个epoch开始时打乱数据顺序
-train_dl = torch.utils.data.DataLoader(train_ds, batch_size=16, shuffle=True)
+# BATCH_SIZE是每次前向传播的微批大小，ACCUM_STEPS个微批累积一次梯度，有效批大小为两者之积
+# （model.training按有效批大小线性缩放学习率）
+BATCH_SIZE = 16
+ACCUM_STEPS = 1
+# SAMPLER可选None（普通打乱）、'balanced'（类别均衡抽样）或'hard'（按损失加权的困难样本挖掘）
+SAMPLER = None
+if SAMPLER is None:
+    train_dl = torch.utils.data.DataLoader(train_ds, batch_size=BATCH_SIZE, shuffle=True)
+else:
+    from samplers import ClassBalancedSampler, HardExampleSampler, dataset_labels
+    if SAMPLER == 'balanced':
+        train_sampler = ClassBalancedSampler(dataset_labels(train_ds), seed=SEED)
+    else:
+        train_sampler = HardExampleSampler(len(train_ds), seed=SEED)
+    train_dl = torch.utils.data.DataLoader(train_ds, batch_size=BATCH_SIZE, sampler=train_sampler)
+
+# 可选：由后台进程池把后续样本（包括下一个epoch）预先计算到共享内存环形缓冲区，
+# 训练循环不再等待数据预处理。MAX_PREFETCH_MB限制缓冲区占用的内存
+PREFETCH = False
+PREFETCH_WORKERS = 2
+MAX_PREFETCH_MB = 512
+if PREFETCH:
+    from prefetch import PrefetchLoader
+    train_dl = PrefetchLoader(train_ds, batch_size=BATCH_SIZE, shuffle=True, seed=SEED,
+                              num_workers=PREFETCH_WORKERS, max_memory_mb=MAX_PREFETCH_MB)
 
 # 使用PyTorch的数据加载器来组织验证数据集
 # 验证数据集的加载不需要打乱数据顺序，因此shuffle设为False
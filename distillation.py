@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+from feature_cache import CachedSoundDS, load_or_build_feature_cache
+from model import AudioClassifier, build_model, normalize_inputs, training, device
+
+TEACHER_VARIANT = 'large'  # 教师模型，见model.MODEL_VARIANTS
+AUG_EPOCHS = 10  # 缓存多少个epoch的增强视图；学生在第e个epoch使用第e % AUG_EPOCHS个视图
+ALPHA = 0.5  # KL损失所占的比例
+TEMPERATURE = 4.0
+DISTILL_DIR = Path.cwd()/'distill'
+
+
+# ----------------------------
+# Teacher logits cache
+# ----------------------------
+def model_fingerprint(model):
+    """
+    模型所有参数和缓冲区（名称、形状、数值）的sha256，权重有任何变化时都不同。
+    """
+    digest = hashlib.sha256()
+    for name, tensor in model.state_dict().items():
+        digest.update(f'{name}:{tuple(tensor.shape)}:{tensor.dtype}'.encode('utf-8'))
+        digest.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+
+def cache_teacher_logits(teacher, ds, out_dir=DISTILL_DIR, aug_epochs=AUG_EPOCHS, batch_size=64,
+                         teacher_variant=None):
+    """
+    对数据集每个样本的每个增强视图（由(seed, epoch, idx)确定）各做一次教师前向传播，把logits写入
+    out_dir/teacher_logits.npy（形状[aug_epochs, N, classes]，float32）。已存在且参数相同的缓存直接复用，
+    因此教师的前向传播在整个训练过程中只做一次。缓存参数包含教师的变体名和权重指纹，换了教师或
+    重新训练后不会复用旧的logits；logits先写入临时文件，全部写完后才替换缓存并写入参数文件。
+
+    参数:
+    - teacher: 训练好的教师模型。
+    - ds: 带增强的CachedSoundDS（必须设置seed，否则增强无法重放）。
+    - aug_epochs: 缓存的增强视图数量。
+    - teacher_variant: 教师的变体名（见model.MODEL_VARIANTS），记录在缓存参数中。
+
+    返回:
+    - Path: teacher_logits.npy的路径。
+    """
+    if ds.seed is None:
+        raise ValueError('teacher logits can only be cached for a seeded dataset')
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path, meta_file = out_dir/'teacher_logits.npy', out_dir/'teacher_logits.json'
+    meta = {'cache': str(ds.cache_dir), 'num_items': len(ds), 'seed': ds.seed, 'aug_epochs': aug_epochs,
+            'shift_pct': ds.shift_pct, 'max_mask_pct': ds.max_mask_pct, 'n_freq_masks': ds.n_freq_masks,
+            'n_time_masks': ds.n_time_masks, 'teacher_variant': teacher_variant,
+            'teacher_sha256': model_fingerprint(teacher), 'normalization': 'per_sample'}
+    if path.exists() and meta_file.exists():
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            if json.load(f) == meta:
+                return path
+    # Invalidate the old cache before writing, so a crash can never leave
+    # stale parameters next to half-written logits
+    meta_file.unlink(missing_ok=True)
+    tmp_path = out_dir/'teacher_logits.tmp.npy'
+
+    teacher.eval()
+    logits = None
+    for epoch in range(aug_epochs):
+        ds.set_epoch(epoch)
+        pos = 0
+        with torch.no_grad():
+            for inputs, _ in DataLoader(ds, batch_size=batch_size, shuffle=False):
+                inputs = inputs.to(device, torch.float32)
+                # Same per-sample normalization as training(): a sample's logits do
+                # not depend on the batch it is in here or in the student's batches
+                inputs = normalize_inputs(inputs)
+                out = teacher(inputs).cpu().numpy()
+                if logits is None:
+                    logits = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                                       shape=(aug_epochs, len(ds), out.shape[1]))
+                logits[epoch, pos:pos + len(out)] = out
+                pos += len(out)
+        print(f'Teacher logits for augmentation epoch {epoch} cached')
+    logits.flush()
+    del logits
+    os.replace(tmp_path, path)
+    with open(meta_file.with_suffix('.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(meta_file.with_suffix('.json.tmp'), meta_file)
+    return path
+
+
+class DistillDS(Dataset):
+    """
+    DistillDS在CachedSoundDS的样本后附加缓存的教师logits：返回(声谱图, 类ID, 教师logits)。
+    第e个epoch使用第e % aug_epochs个增强视图，与教师当时看到的输入完全相同。
+
+    参数:
+    - ds: 与cache_teacher_logits相同的带增强CachedSoundDS。
+    - logits_path: cache_teacher_logits返回的路径。
+    """
+    def __init__(self, ds, logits_path):
+        self.ds = ds
+        self.logits_path = Path(logits_path)
+        self.aug_epochs = np.load(self.logits_path, mmap_mode='r').shape[0]
+        self.epoch = 0
+        self._logits = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_logits'] = None
+        return state
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.ds)
+
+    def __getitem__(self, idx):
+        if self._logits is None:
+            self._logits = np.load(self.logits_path, mmap_mode='r')
+        aug_epoch = self.epoch % self.aug_epochs
+        sgram, class_id = self.ds.get_item(idx, aug_epoch)
+        return sgram, class_id, torch.from_numpy(np.array(self._logits[aug_epoch, idx]))
+
+
+if __name__ == "__main__":
+    from dataset_us8k import train_ds, val_ds, FEATURE_CACHE_DIR, SEED
+
+    parser = argparse.ArgumentParser(description='Distil a large teacher into AudioClassifier using cached teacher logits')
+    parser.add_argument('--teacher-checkpoint', default=None, help='trained teacher weights (trained here if omitted)')
+    parser.add_argument('--teacher-variant', default=TEACHER_VARIANT)
+    parser.add_argument('--teacher-epochs', type=int, default=60)
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--aug-epochs', type=int, default=AUG_EPOCHS)
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    parser.add_argument('--temperature', type=float, default=TEMPERATURE)
+    parser.add_argument('--output', default='student_model.pt')
+    args = parser.parse_args()
+
+    train_cache = load_or_build_feature_cache(train_ds, FEATURE_CACHE_DIR/'train')
+    val_cache = load_or_build_feature_cache(val_ds, FEATURE_CACHE_DIR/'val')
+    train_aug = CachedSoundDS(train_cache, augment=True, seed=SEED)
+    val_dl = DataLoader(CachedSoundDS(val_cache), batch_size=64, shuffle=False)
+
+    teacher = build_model(args.teacher_variant).to(device)
+    if args.teacher_checkpoint:
+        teacher.load_state_dict(torch.load(args.teacher_checkpoint, map_location=device))
+    else:
+        teacher_ckpt = DISTILL_DIR/f'teacher_{args.teacher_variant}.pt'
+        DISTILL_DIR.mkdir(parents=True, exist_ok=True)
+        training(teacher, DataLoader(train_aug, batch_size=16, shuffle=True), args.teacher_epochs, val_dl=val_dl,
+                 patience=10, checkpoint_path=teacher_ckpt)
+
+    logits_path = cache_teacher_logits(teacher, train_aug, aug_epochs=args.aug_epochs,
+                                       teacher_variant=args.teacher_variant)
+    student = AudioClassifier().to(device)
+    training(student, DataLoader(DistillDS(train_aug, logits_path), batch_size=16, shuffle=True), args.epochs,
+             val_dl=val_dl, patience=10, checkpoint_path=args.output, distill_alpha=args.alpha,
+             temperature=args.temperature)
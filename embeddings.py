@@ -0,0 +1,258 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from Classification import AudioUtil
+from feature_cache import CachedSoundDS, load_or_build_feature_cache
+from model import device, load_classifier, normalize_inputs
+
+EMBEDDING_DIR = Path.cwd()/'embeddings'  # embeddings.npy、items.json和索引文件所在目录
+
+
+# ----------------------------
+# Embedding extraction
+# ----------------------------
+def embed_batch(model, inputs):
+    """
+    计算一批声谱图的L2归一化嵌入向量（AudioClassifier线性层之前的池化向量）。
+
+    返回:
+    - numpy.ndarray: [batch, 嵌入维度]的float32数组。
+    """
+    with torch.no_grad():
+        emb = model.embed(normalize_inputs(inputs.to(device, torch.float32)))
+        emb = torch.nn.functional.normalize(emb, dim=1)
+    return emb.cpu().numpy().astype(np.float32)
+
+
+def embed_corpus(model, cache_dir, out_dir=EMBEDDING_DIR, batch_size=256, num_workers=0):
+    """
+    通过特征缓存计算整个语料库的嵌入向量，按缓存中的顺序连续写入out_dir/embeddings.npy（float32，内存映射）。
+
+    参数:
+    - model: 训练好的AudioClassifier。
+    - cache_dir: build_feature_cache生成的缓存目录。
+    - out_dir: 输出目录。
+
+    返回:
+    - Path: embeddings.npy的路径。
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ds = CachedSoundDS(cache_dir)
+    model.eval()
+
+    path = out_dir/'embeddings.npy'
+    matrix = None
+    pos = 0
+    start = time.monotonic()
+    for inputs, _ in DataLoader(ds, batch_size=batch_size, shuffle=False, num_workers=num_workers):
+        emb = embed_batch(model, inputs)
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(ds), emb.shape[1]))
+        matrix[pos:pos + len(emb)] = emb
+        pos += len(emb)
+    matrix.flush()
+    elapsed = time.monotonic() - start
+    print(f'Embedded {pos} clips in {elapsed:.1f} s ({pos / elapsed:.0f} clips/s)')
+    return path
+
+
+# ----------------------------
+# Exact search
+# ----------------------------
+def _top_k(scores, k):
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    idx = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(scores, idx, axis=1), idx
+
+
+class BruteForceIndex():
+    """
+    BruteForceIndex对全部向量做精确的余弦相似度搜索（向量已归一化，内积即余弦），
+    用BLAS矩阵乘法分块计算，适合几十万到几百万条向量。
+
+    参数:
+    - vectors: [N, D]的float32嵌入矩阵（可以是内存映射数组）。
+    - chunk_size: 每次与查询相乘的行数，限制中间结果的内存。
+    """
+    def __init__(self, vectors, chunk_size=1 << 18):
+        self.vectors = vectors
+        self.chunk_size = chunk_size
+
+    def search(self, queries, k=10):
+        """
+        返回:
+        - tuple: (相似度[Q, k], 向量编号[Q, k])，按相似度降序排列。
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_scores, best_ids = None, None
+        for start in range(0, len(self.vectors), self.chunk_size):
+            chunk = np.asarray(self.vectors[start:start + self.chunk_size])
+            scores, ids = _top_k(queries @ chunk.T, k)
+            ids += start
+            if best_scores is not None:
+                scores = np.concatenate([best_scores, scores], axis=1)
+                ids = np.concatenate([best_ids, ids], axis=1)
+                scores, pos = _top_k(scores, k)
+                ids = np.take_along_axis(ids, pos, axis=1)
+            best_scores, best_ids = scores, ids
+        return best_scores, best_ids
+
+
+# ----------------------------
+# Approximate search: inverted file (IVF)
+# ----------------------------
+class IVFIndex():
+    """
+    IVFIndex用球面k-means把向量划分为n_lists个簇，每个簇的向量连续存放；查询时只扫描与查询最相似的
+    nprobe个簇，扫描量约为N * nprobe / n_lists，在数百万条向量上也能做到毫秒级查询。
+
+    参数:
+    - centroids: [n_lists, D]的簇中心。
+    - vectors: 按簇排序后的向量。
+    - ids: vectors中每一行对应的原始向量编号。
+    - offsets: 长度为n_lists + 1，第i个簇的向量为vectors[offsets[i]:offsets[i + 1]]。
+    """
+    def __init__(self, centroids, vectors, ids, offsets):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk_size=1 << 16):
+        out = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = np.asarray(vectors[start:start + chunk_size])
+            out[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return out
+
+    @classmethod
+    def build(cls, vectors, n_lists=1024, n_iter=20, sample_size=256 * 1024, seed=0):
+        """
+        在最多sample_size条随机样本上训练球面k-means，再把全部向量分配到最近的簇。
+        """
+        rng = np.random.default_rng(seed)
+        n_lists = min(n_lists, len(vectors))
+        sample_idx = np.sort(rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False))
+        sample = np.asarray(vectors[sample_idx])
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = cls._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            # 空簇重新用随机样本初始化
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(min=1e-12)
+
+        assign = cls._assign(vectors, centroids)
+        ids = np.argsort(assign, kind='stable')
+        offsets = np.searchsorted(assign[ids], np.arange(n_lists + 1))
+        return cls(centroids.astype(np.float32), np.ascontiguousarray(np.asarray(vectors)[ids]), ids, offsets)
+
+    def search(self, queries, k=10, nprobe=8):
+        """
+        返回:
+        - tuple: (相似度[Q, k], 向量编号[Q, k])，候选不足k个时用-inf和-1补齐。
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for qi, q in enumerate(queries):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes[qi]])
+            if len(rows) == 0:
+                continue
+            scores, pos = _top_k((self.vectors[rows] @ q)[None, :], k)
+            all_scores[qi, :scores.shape[1]] = scores[0]
+            all_ids[qi, :scores.shape[1]] = self.ids[rows[pos[0]]]
+        return all_scores, all_ids
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, vectors=self.vectors, ids=self.ids, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['centroids'], data['vectors'], data['ids'], data['offsets'])
+
+
+def load_index(out_dir=EMBEDDING_DIR, kind='exact'):
+    """
+    加载out_dir中的索引：'exact'直接内存映射embeddings.npy，'ivf'读取ivf_index.npz。
+    """
+    out_dir = Path(out_dir)
+    if kind == 'ivf':
+        return IVFIndex.load(out_dir/'ivf_index.npz')
+    return BruteForceIndex(np.load(out_dir/'embeddings.npy', mmap_mode='r'))
+
+
+# ----------------------------
+# Query clip -> spectrogram
+# ----------------------------
+def clip_spectrogram(audio_file, ds):
+    """
+    按数据集ds（SoundDS）的参数把一个音频文件处理成未增强的梅尔频谱图，与特征缓存中的处理方式相同。
+    """
+    aud = AudioUtil.open(audio_file)
+    reaud = AudioUtil.resample(aud, ds.sr)
+    rechan = AudioUtil.rechannel(reaud, ds.channel)
+    dur_aud = AudioUtil.pad_trunc(rechan, ds.duration, generator=torch.Generator().manual_seed(0))
+    return AudioUtil.spectro_gram(dur_aud, n_mels=ds.n_mels, n_fft=ds.n_fft, hop_len=ds.hop_len)
+
+
+if __name__ == "__main__":
+    from dataset_us8k import myds, FEATURE_CACHE_DIR
+
+    parser = argparse.ArgumentParser(description='Embed the corpus with AudioClassifier and search similar clips')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='embed every clip of the dataset and build the indexes')
+    build.add_argument('--checkpoint', default='best_model.pt')
+    build.add_argument('--out', default=str(EMBEDDING_DIR))
+    build.add_argument('--lists', type=int, default=1024, help='number of IVF lists (0 to skip the IVF index)')
+    build.add_argument('--workers', type=int, default=0)
+    query = sub.add_parser('query', help='find clips that sound like a given WAV file')
+    query.add_argument('file')
+    query.add_argument('--checkpoint', default='best_model.pt')
+    query.add_argument('--out', default=str(EMBEDDING_DIR))
+    query.add_argument('-k', type=int, default=10)
+    query.add_argument('--index', choices=['exact', 'ivf'], default='exact')
+    query.add_argument('--nprobe', type=int, default=8)
+    args = parser.parse_args()
+
+    model = load_classifier(args.checkpoint)
+    out_dir = Path(args.out)
+
+    if args.command == 'build':
+        cache_dir = load_or_build_feature_cache(myds, FEATURE_CACHE_DIR/'all', num_workers=args.workers)
+        path = embed_corpus(model, cache_dir, out_dir, num_workers=args.workers)
+        with open(out_dir/'items.json', 'w', encoding='utf-8') as f:
+            json.dump(myds.df[['relative_path', 'classID']].to_dict('records'), f, ensure_ascii=False)
+        if args.lists > 0:
+            start = time.monotonic()
+            IVFIndex.build(np.load(path, mmap_mode='r'), n_lists=args.lists).save(out_dir/'ivf_index.npz')
+            print(f'IVF index with {args.lists} lists built in {time.monotonic() - start:.1f} s')
+    else:
+        with open(out_dir/'items.json', 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        index = load_index(out_dir, args.index)
+        q = embed_batch(model, clip_spectrogram(args.file, myds)[None])
+        start = time.perf_counter()
+        if args.index == 'ivf':
+            scores, ids = index.search(q, args.k, nprobe=args.nprobe)
+        else:
+            scores, ids = index.search(q, args.k)
+        print(f'Search took {(time.perf_counter() - start) * 1000:.2f} ms')
+        for score, i in zip(scores[0], ids[0]):
+            if i >= 0:
+                print(f'{score:.4f}  {items[i]["relative_path"]}  classID={items[i]["classID"]}')
@@ -1,82 +1,307 @@
 from langchain.text_splitter import MarkdownHeaderTextSplitter, MarkdownTextSplitter
+from langchain.docstore.document import Document
+from collections import OrderedDict
+from itertools import islice
+import bisect
+import hashlib
 import os
 import pandas as pd
 
 # 配置参数
 SOURCE_MD_PATH = os.path.join(os.path.pardir, 'outputs', 'MinerU_parsed_20241204', '2024全球经济金融展望报告.md')
 OUTPUT_DIR = "split_markdown_docs"  # 输出文件夹名称
+EXPORT_MARKDOWN = False  # 除切片库外，是否另外把每个切片导出为一个.md文件
 MAX_CHUNK_LENGTH = 700  # 触发二次切分的长度阈值
 CHUNK_SIZE = 500  # 二次切分的块大小
 CHUNK_OVERLAP = 50  # 块重叠量
+HEADERS_TO_SPLIT = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]  # 作为切分依据的标题级别
+MAX_SECTION_CHARS = 1_000_000  # 流式切分时单个章节缓冲的上限，超过后在段落边界处提前产出
+TOKENIZER_PATH = None  # 按token数切分时使用的分词器（如本地Qwen模型目录），为None时按字符数切分
+MAX_CHUNK_TOKENS = 512  # 按token数切分时触发二次切分的阈值
+CHUNK_TOKENS = 384  # 按token数切分时二次切分的块大小
+CHUNK_OVERLAP_TOKENS = 32  # 按token数切分时的块重叠量
+TOKENIZE_BATCH_SIZE = 64  # 每次批量分词的章节数
+TOKEN_CACHE_SIZE = 100_000  # token计数缓存的条目数（以文本的sha1为键，每条约百字节，与文本长度无关）
 
 def load_markdown_document(file_path):
     """加载Markdown文档并处理编码"""
     with open(file_path, 'r', encoding='utf-8') as f:
         return f.read()
 
+def iter_markdown_lines(file_path):
+    """逐行读取Markdown文档，不把整个文件读入内存"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        line = '\n'
+        for line in f:
+            yield line.rstrip('\n')
+        if line.endswith('\n'):  # 与text.split('\n')一致：以换行结尾时最后还有一个空行
+            yield ''
+
 def title_preserving_splitter(text):
     """基于标题切分并保留标题在切片内容中"""
-    headers_to_split = [
-        ("#", "Header 1"),
-        ("##", "Header 2"),
-        ("###", "Header 3")
-    ]
-    return MarkdownHeaderTextSplitter(headers_to_split, strip_headers=False).split_text(text)
+    return MarkdownHeaderTextSplitter(HEADERS_TO_SPLIT, strip_headers=False).split_text(text)
+
+def header_lines(metadata, headers_to_split=HEADERS_TO_SPLIT):
+    """根据切片元数据重建各级标题行"""
+    return [f'{sep} {metadata[name]}' for sep, name in headers_to_split if name in metadata]
+
+def iter_mapped_sections(lines, headers_to_split=HEADERS_TO_SPLIT, max_section_chars=MAX_SECTION_CHARS):
+    """iter_header_sections的实现，产出(章节, 章节内容到源文件字符位置的映射[(内容偏移, 源文件偏移), ...])"""
+    separators = sorted(headers_to_split, key=lambda header: len(header[0]), reverse=True)
+    header_stack = []  # 当前所在的各级标题 (级别, 元数据名)
+    metadata = {}  # 标题栈对应的元数据
+    paragraph, paragraph_offsets, paragraph_metadata = [], [], {}  # 当前段落的行、各行在源文件中的位置及其元数据
+    section, section_metadata, section_chars = [], {}, 0  # 正在累积的章节（同一标题下的段落）
+    line_map, section_end = [], 0  # 章节每一行的(内容偏移, 源文件偏移)，章节在源文件中的结束位置
+    in_code_block, opening_fence = False, ""
+    pos = 0  # 当前行在源文件（换行统一为\n）中的字符位置
+
+    def finished_section():
+        return Document(page_content="  \n".join(section), metadata={
+            **section_metadata, "char_start": line_map[0][1], "char_end": section_end}), line_map
+
+    def close_paragraph():
+        # 把段落并入当前章节；章节结束时产出它
+        nonlocal section, section_metadata, section_chars, line_map, section_end
+        if not paragraph:
+            return
+        text = "\n".join(paragraph)
+        last_line = section[-1][section[-1].rfind("\n") + 1:] if section else ""
+        if section and (section_metadata == paragraph_metadata or (
+                len(section_metadata) < len(paragraph_metadata) and last_line.startswith("#"))):
+            # 同一标题下的段落，或紧跟在上级标题之后的下级标题，合并到当前章节
+            section.append(text)
+            offset = section_chars + 3
+            section_chars += len(text) + 3
+            section_metadata = paragraph_metadata.copy()
+        else:
+            if section:
+                yield finished_section()
+            section, section_metadata, section_chars = [text], paragraph_metadata.copy(), len(text)
+            offset, line_map = 0, []
+        for line, source_offset in zip(paragraph, paragraph_offsets):
+            line_map.append((offset, source_offset))
+            offset += len(line) + 1
+        section_end = paragraph_offsets[-1] + len(paragraph[-1])
+        paragraph.clear()
+        paragraph_offsets.clear()
+        if section_chars > max_section_chars:
+            # 超长章节提前产出，后续段落以标题行开头以保留上下文
+            yield finished_section()
+            titles = "\n".join(header_lines(section_metadata, headers_to_split))
+            section, section_chars = ([titles], len(titles)) if titles else ([], 0)
+            line_map = [(0, section_end)] if titles else []
+
+    for line in lines:
+        line_start, pos = pos, pos + len(line) + 1
+        stripped_line = "".join(filter(str.isprintable, line.strip()))
+        source_offset = line_start + len(line) - len(line.lstrip())
+        if not in_code_block:
+            if stripped_line.startswith("```") and stripped_line.count("```") == 1:
+                in_code_block, opening_fence = True, "```"
+            elif stripped_line.startswith("~~~"):
+                in_code_block, opening_fence = True, "~~~"
+        elif stripped_line.startswith(opening_fence):
+            in_code_block, opening_fence = False, ""
+        if in_code_block:
+            paragraph.append(stripped_line)
+            paragraph_offsets.append(source_offset)
+            continue
+
+        for sep, name in separators:
+            if stripped_line.startswith(sep) and (len(stripped_line) == len(sep) or stripped_line[len(sep)] == " "):
+                level = sep.count("#")
+                while header_stack and header_stack[-1][0] >= level:
+                    metadata.pop(header_stack.pop()[1], None)
+                header_stack.append((level, name))
+                metadata[name] = stripped_line[len(sep):].strip()
+                yield from close_paragraph()
+                paragraph.append(stripped_line)
+                paragraph_offsets.append(source_offset)
+                break
+        else:
+            if stripped_line:
+                paragraph.append(stripped_line)
+                paragraph_offsets.append(source_offset)
+            else:
+                yield from close_paragraph()
+        paragraph_metadata = metadata.copy()
+
+    yield from close_paragraph()
+    if section:
+        yield finished_section()
+
+def iter_header_sections(lines, headers_to_split=HEADERS_TO_SPLIT, max_section_chars=MAX_SECTION_CHARS):
+    """title_preserving_splitter的流式版本：维护标题栈，每当一个章节结束立即产出它
+
+    与MarkdownHeaderTextSplitter(strip_headers=False)的切分结果相同，元数据中另外记录章节在源文件中的
+    字符范围char_start/char_end；只有超过max_section_chars的章节会在段落边界处分成几段产出，后面的段落以标题行开头。
+    """
+    for doc, _ in iter_mapped_sections(lines, headers_to_split, max_section_chars):
+        yield doc
+
+def source_range(line_map, start, end):
+    """把章节内容中的字符范围[start, end)映射为源文件中的字符范围"""
+    content_offsets = [offset for offset, _ in line_map]
+    i = bisect.bisect_right(content_offsets, start) - 1
+    j = bisect.bisect_right(content_offsets, max(start, end - 1)) - 1
+    return line_map[i][1] + start - line_map[i][0], line_map[j][1] + end - line_map[j][0]
 
 def propagate_headers_to_chunks(original_doc, sub_chunks):
     """将原始文档的标题信息传播到二次切分的子片段"""
     if not sub_chunks: return []
-    header_lines = [
-        f'{"#"*level} {original_doc.metadata.get(f"Header {level}", "")}' 
-        for level in range(1, 4) 
-        if f"Header {level}" in original_doc.metadata
-    ]
+    titles = header_lines(original_doc.metadata)
     for doc in sub_chunks[1:]:  # 首个切片已包含完整标题，后续切片补充标题前缀
-        doc.page_content = '\n'.join(header_lines) + '\n' + doc.page_content
+        doc.page_content = '\n'.join(titles) + '\n' + doc.page_content
     return sub_chunks
 
-def optimize_chunk_length(original_docs, max_length=MAX_CHUNK_LENGTH):
-    """对超长切片进行二次切分并保留标题上下文"""
+def iter_optimized_chunks(original_docs, max_length=MAX_CHUNK_LENGTH):
+    """optimize_chunk_length的流式版本：逐个切片处理并立即产出"""
     splitter = MarkdownTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    optimized_docs = []
     for doc in original_docs:
         if len(doc.page_content) > max_length:
-            sub_chunks = splitter.split_documents([doc])
-            optimized_docs.extend(propagate_headers_to_chunks(doc, sub_chunks))
+            yield from propagate_headers_to_chunks(doc, splitter.split_documents([doc]))
         else:
-            optimized_docs.append(doc)
-    return optimized_docs
-
-def save_chunks_to_disk(chunks, output_dir=OUTPUT_DIR):
-    """将切分后的文档保存到指定文件夹"""
-    os.makedirs(output_dir, exist_ok=True)  # 创建输出目录
-    for idx, doc in enumerate(chunks, 1):
-        # 生成带标题的文件名（使用一级标题，若无则用默认命名）
-        title = doc.metadata.get("Header 1", f"chunk_{idx}").replace("/", "_")  # 处理非法字符
-        file_name = f"{idx:03d}_{title[:30]}.md"  # 限制文件名长度防止过长
-        file_path = os.path.join(output_dir, file_name)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(doc.page_content)
-        
-        print(f"已保存切片 {idx}: {file_path}")
+            yield doc
+
+def optimize_chunk_length(original_docs, max_length=MAX_CHUNK_LENGTH):
+    """对超长切片进行二次切分并保留标题上下文"""
+    return list(iter_optimized_chunks(original_docs, max_length))
+
+class TokenCounter:
+    """带缓存的token计数器：相同文本只分词一次，count_batch把多段文本交给fast tokenizer批量分词
+
+    缓存以文本的sha1摘要为键，不保留文本本身，章节再长缓存的内存也只与条目数有关。
+    """
+    def __init__(self, tokenizer_path, cache_size=TOKEN_CACHE_SIZE):
+        from transformers import AutoTokenizer
+        self.tokenizer_path = tokenizer_path
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path, use_fast=True, trust_remote_code=True)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # 文本的sha1摘要 -> token数，按最近使用排序
+
+    def count_batch(self, texts):
+        """返回每段文本的token数（不含特殊token）"""
+        keys = [hashlib.sha1(text.encode('utf-8')).digest() for text in texts]
+        counts = {}
+        for key in keys:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                counts[key] = self.cache[key]
+        missing = {key: text for key, text in zip(keys, texts) if key not in counts}
+        if missing:
+            input_ids = self.tokenizer(list(missing.values()), add_special_tokens=False, verbose=False)["input_ids"]
+            for key, ids in zip(missing, input_ids):
+                counts[key] = self.cache[key] = len(ids)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return [counts[key] for key in keys]
+
+    def __call__(self, text):
+        return self.count_batch([text])[0]
+
+def make_splitter(counter=None):
+    """二次切分用的splitter：默认按字符数，给定TokenCounter时按token数"""
+    if counter is None:
+        return MarkdownTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return MarkdownTextSplitter(chunk_size=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS, length_function=counter)
+
+def locate_chunks(text, chunks):
+    """每个切片在章节文本中的起始位置：切片按顺序排列且起点严格递增，从上一个切片的起点之后查找
+
+    不使用langchain的add_start_index：它从上一个切片的末尾减去chunk_overlap处开始查找，按token切分时
+    chunk_overlap是token数而不是字符数，重叠部分长于它时会找不到切片（得到-1）。
+    """
+    starts, pos = [], 0
+    for chunk in chunks:
+        start = text.find(chunk, pos)
+        if start < 0:
+            raise ValueError(f"chunk not found in its section after offset {pos}: {chunk[:50]!r}")
+        starts.append(start)
+        pos = start + 1
+    return starts
+
+def split_section(doc, line_map, splitter, max_length=MAX_CHUNK_LENGTH, size=None):
+    """对一个章节做二次切分，并为每个切片记录源文件中的字符范围
+
+    size为章节的长度（按token切分时为token数），默认为字符数。
+    """
+    if (len(doc.page_content) if size is None else size) <= max_length:
+        return [doc]
+    sub_chunks = splitter.split_documents([doc])
+    starts = locate_chunks(doc.page_content, [sub.page_content for sub in sub_chunks])
+    for sub, start in zip(sub_chunks, starts):
+        sub.metadata["char_start"], sub.metadata["char_end"] = source_range(
+            line_map, start, start + len(sub.page_content))
+    return propagate_headers_to_chunks(doc, sub_chunks)
+
+def split_sections(sections, splitter, max_length, counter=None):
+    """对一批(章节, 位置映射)做二次切分，返回每个章节的切片列表
+
+    给定counter时章节长度按token数计算，并批量统计每个切片的token数，记录在元数据tokens中。
+    """
+    if counter is None:
+        return [split_section(doc, line_map, splitter, max_length) for doc, line_map in sections]
+    sizes = counter.count_batch([doc.page_content for doc, _ in sections])
+    results = [split_section(doc, line_map, splitter, max_length, size)
+               for (doc, line_map), size in zip(sections, sizes)]
+    chunks = [chunk for result in results for chunk in result]
+    for chunk, tokens in zip(chunks, counter.count_batch([chunk.page_content for chunk in chunks])):
+        chunk.metadata["tokens"] = tokens
+    return results
+
+def batched(iterable, n):
+    """把可迭代对象按n个一组产出"""
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+def stream_split_markdown(file_path, max_length=None, counter=None):
+    """流式切分流程：逐行读取文档，每个章节结束后立即产出其最终切片，内存占用与文档大小无关
+
+    切片与optimize_chunk_length(title_preserving_splitter(...))相同，元数据中另外记录切片在源文件中的字符范围。
+    给定TokenCounter时按token数切分（max_length默认为MAX_CHUNK_TOKENS），每TOKENIZE_BATCH_SIZE个章节批量分词一次。
+    """
+    if max_length is None:
+        max_length = MAX_CHUNK_LENGTH if counter is None else MAX_CHUNK_TOKENS
+    splitter = make_splitter(counter)
+    sections = iter_mapped_sections(iter_markdown_lines(file_path))
+    for batch in batched(sections, 1 if counter is None else TOKENIZE_BATCH_SIZE):
+        for chunks in split_sections(batch, splitter, max_length, counter):
+            yield from chunks
+
+def token_stats(token_counts, max_tokens=MAX_CHUNK_TOKENS):
+    """每个切片token数的统计信息，以及超过max_tokens的切片数"""
+    stats = pd.Series(token_counts, dtype="int64").describe(percentiles=[0.5, 0.9, 0.99])
+    stats["over_budget"] = sum(count > max_tokens for count in token_counts)
+    return stats
+
+def chunk_file_name(idx, doc):
+    """生成带标题的文件名（使用一级标题，若无则用默认命名）"""
+    title = doc.metadata.get("Header 1", f"chunk_{idx}").replace("/", "_")  # 处理非法字符
+    return f"{idx:03d}_{title[:30]}.md"  # 限制文件名长度防止过长
 
 # 完整处理流程
 if __name__ == "__main__":
-    # 1. 加载原始文档
-    markdown_content = load_markdown_document(SOURCE_MD_PATH)
-    
-    # 2. 首次切分（保留标题）
-    first_split_docs = title_preserving_splitter(markdown_content)
-    
-    # 3. 二次切分优化长度
-    final_optimized_docs = optimize_chunk_length(first_split_docs)
+    from chunk_store import CHUNK_STORE_PATH, export_markdown, write_chunks
+
+    # 1-3. 流式读取文档、按标题切分并对超长切片二次切分（每个章节结束后立即产出切片）
+    # 配置了TOKENIZER_PATH时按目标LLM的token数切分
+    token_counter = TokenCounter(TOKENIZER_PATH) if TOKENIZER_PATH else None
+    final_optimized_docs = stream_split_markdown(SOURCE_MD_PATH, counter=token_counter)
     
-    # 4. 保存到磁盘
-    save_chunks_to_disk(final_optimized_docs)
+    # 4. 批量写入切片库（可选导出为每个切片一个.md文件）
+    doc_id = os.path.splitext(os.path.basename(SOURCE_MD_PATH))[0]
+    chunk_lengths, chunk_tokens = write_chunks(final_optimized_docs, CHUNK_STORE_PATH, doc_id)
+    print(f"已保存 {len(chunk_lengths)} 个切片到 {CHUNK_STORE_PATH}")
+    if EXPORT_MARKDOWN:
+        print(f"已导出 {export_markdown(CHUNK_STORE_PATH, OUTPUT_DIR)} 个.md文件到 {OUTPUT_DIR}")
     
     # 5. 输出统计信息
-    final_length_stats = pd.Series([len(doc.page_content) for doc in final_optimized_docs]).describe()
+    final_length_stats = pd.Series(chunk_lengths).describe()
     print("\n最终切片长度统计：")
     print(final_length_stats)
+    if chunk_tokens:
+        print("\n每个切片的token数统计：")
+        print(token_stats(chunk_tokens))
   
\ No newline at end of file
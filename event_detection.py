@@ -0,0 +1,174 @@
+import argparse
+import time
+
+import pandas as pd
+import torch
+from torchaudio import transforms
+from Classification import AudioUtil
+from model import EventDetector, classifier_from_state, device, normalize_inputs, train_event_detector
+
+# UrbanSound8K class names, indexed by classID
+CLASS_NAMES = ['air_conditioner', 'car_horn', 'children_playing', 'dog_bark', 'drilling', 'engine_idling',
+               'gun_shot', 'jackhammer', 'siren', 'street_music']
+SR = 44100
+CHANNEL = 2
+N_MELS = 64
+N_FFT = 1024
+HOP_LEN = N_FFT // 2  # MelSpectrogram的默认hop_length
+SEGMENT_S = 60  # 计算长音频频谱图时每段的秒数，限制STFT的中间内存
+CLIP_S = 4  # 训练样本的时长（dataset_us8k中duration=4000ms），分贝转换的top_db按这个长度的块计算
+
+
+# ----------------------------
+# Spectrogram of a whole recording
+# ----------------------------
+def long_spectrogram(audio_file, segment_s=SEGMENT_S):
+    """
+    计算整段长音频的梅尔频谱图（不做pad_trunc截断）。波形按segment_s秒分段计算后在时间轴上拼接，
+    每段长度是hop的整数倍，因此各段的帧在时间上对齐；不足N_FFT // 2个采样的尾段并入前一段
+    （center=True的反射填充要求输入比填充长）。与训练时对每个样本分别做分贝转换一样，top_db
+    按每CLIP_S秒的块分别计算，而不是对整段录音计算一次。
+
+    参数:
+    - audio_file: 音频文件路径。
+    - segment_s: 每段的秒数。
+
+    返回:
+    - Tensor: [channel, n_mels, frames]的频谱图（dB）。
+    """
+    aud = AudioUtil.rechannel(AudioUtil.resample(AudioUtil.open(audio_file), SR), CHANNEL)
+    sig, sr = aud
+    mel = transforms.MelSpectrogram(sr, n_fft=N_FFT, hop_length=HOP_LEN, n_mels=N_MELS)
+    to_db = transforms.AmplitudeToDB(top_db=80)
+    clip_frames = max(1, int(CLIP_S * sr) // HOP_LEN)
+    # 每段是分贝块长度的整数倍，分贝块在整段录音上对齐
+    seg_len = max(1, (segment_s * sr) // (clip_frames * HOP_LEN)) * clip_frames * HOP_LEN
+    if sig.shape[1] <= N_FFT // 2:
+        sig = torch.nn.functional.pad(sig, (0, N_FFT // 2 + 1 - sig.shape[1]))
+    starts = list(range(0, sig.shape[1], seg_len))
+    if len(starts) > 1 and sig.shape[1] - starts[-1] <= N_FFT // 2:
+        starts.pop()
+    specs = []
+    for i, start in enumerate(starts):
+        last = i == len(starts) - 1
+        spec = mel(sig[:, start:] if last else sig[:, start:start + seg_len])
+        # center=True为每段多生成一帧，去掉它使帧数等于 段长 / hop
+        if not last:
+            spec = spec[..., :seg_len // HOP_LEN]
+        specs.extend(to_db(block) for block in spec.split(clip_frames, dim=-1))
+    return torch.cat(specs, dim=-1)
+
+
+def frame_probabilities(detector, spec):
+    """
+    对整段频谱图做一次前向传播，返回每帧每个类别的概率以及每帧对应的秒数。
+
+    返回:
+    - tuple: ([frames, classes]的概率Tensor, 每帧秒数)。
+    """
+    detector.eval()
+    with torch.no_grad():
+        x = normalize_inputs(spec.to(device, torch.float32).unsqueeze(0))
+        probs = torch.sigmoid(detector(x))[0].cpu()
+    frame_s = spec.shape[-1] * HOP_LEN / SR / probs.shape[0]
+    return probs, frame_s
+
+
+# ----------------------------
+# Frames -> timestamped events
+# ----------------------------
+def frames_to_events(probs, frame_s, threshold=0.5, release=None, min_duration=0.2, merge_gap=0.3,
+                     class_names=CLASS_NAMES):
+    """
+    把逐帧的多标签概率合并为带时间戳的事件：概率超过threshold时事件开始，低于release（滞回，默认
+    为threshold）时结束；同一类别间隔小于merge_gap秒的事件合并，短于min_duration秒的事件丢弃。
+
+    参数:
+    - probs: [frames, classes]的概率。
+    - frame_s: 每帧的秒数。
+
+    返回:
+    - list: 按开始时间排序的事件，每个事件为dict（class、classID、onset、offset、score）。
+    """
+    release = threshold if release is None else release
+    events = []
+    for c in range(probs.shape[1]):
+        p = probs[:, c].tolist()
+        runs = []
+        active, start = False, 0
+        for i, v in enumerate(p):
+            if not active and v >= threshold:
+                active, start = True, i
+            elif active and v < release:
+                runs.append([start, i])
+                active = False
+        if active:
+            runs.append([start, len(p)])
+
+        merged = []
+        for run in runs:
+            if merged and (run[0] - merged[-1][1]) * frame_s < merge_gap:
+                merged[-1][1] = run[1]
+            else:
+                merged.append(run)
+
+        for s, e in merged:
+            if (e - s) * frame_s >= min_duration:
+                events.append({'class': class_names[c], 'classID': c, 'onset': round(s * frame_s, 3),
+                               'offset': round(e * frame_s, 3), 'score': max(p[s:e])})
+    return sorted(events, key=lambda ev: (ev['onset'], ev['classID']))
+
+
+def load_detector(checkpoint):
+    """
+    加载检测模型：可以是EventDetector的权重，也可以是AudioClassifier的权重（此时用from_classifier构造）。
+    骨干网络的结构（变体、剪枝后的通道数）和检测头的卷积核大小、类别数都从权重本身读取。
+    """
+    state = torch.load(checkpoint, map_location=device)
+    if 'head.weight' in state:
+        backbone = classifier_from_state({k[len('backbone.'):]: v for k, v in state.items()
+                                          if k.startswith('backbone.')})
+        num_classes, _, kernel_size = state['head.weight'].shape
+        detector = EventDetector(backbone=backbone, num_classes=num_classes, kernel_size=kernel_size)
+        detector.load_state_dict(state)
+    else:
+        detector = EventDetector.from_classifier(classifier_from_state(state))
+    return detector.to(device)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Detect timestamped sound events in a long recording')
+    parser.add_argument('file')
+    parser.add_argument('--checkpoint', default='best_model.pt', help='EventDetector or AudioClassifier weights')
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--release', type=float, default=None)
+    parser.add_argument('--min-duration', type=float, default=0.2)
+    parser.add_argument('--merge-gap', type=float, default=0.3)
+    parser.add_argument('--output', default='events.csv')
+    parser.add_argument('--fine-tune-epochs', type=int, default=0,
+                        help='first fine-tune the detector with BCE on the cached UrbanSound8K clip features')
+    parser.add_argument('--save-detector', default='event_detector.pt', help='where fine-tuned weights are saved')
+    args = parser.parse_args()
+
+    detector = load_detector(args.checkpoint)
+    if args.fine_tune_epochs:
+        from torch.utils.data import DataLoader
+        from dataset_us8k import train_ds, val_ds, FEATURE_CACHE_DIR, SEED
+        from feature_cache import CachedSoundDS, load_or_build_feature_cache
+        train_cache = load_or_build_feature_cache(train_ds, FEATURE_CACHE_DIR/'train')
+        val_cache = load_or_build_feature_cache(val_ds, FEATURE_CACHE_DIR/'val')
+        train_event_detector(detector, DataLoader(CachedSoundDS(train_cache, augment=True, seed=SEED), batch_size=16,
+                                                  shuffle=True),
+                             args.fine_tune_epochs, val_dl=DataLoader(CachedSoundDS(val_cache), batch_size=64),
+                             checkpoint_path=args.save_detector)
+        # 用保存的权重重新加载检测模型，确认检查点可以被load_detector读回
+        detector = load_detector(args.save_detector)
+    start = time.monotonic()
+    spec = long_spectrogram(args.file)
+    probs, frame_s = frame_probabilities(detector, spec)
+    events = frames_to_events(probs, frame_s, args.threshold, args.release, args.min_duration, args.merge_gap)
+    elapsed = time.monotonic() - start
+
+    pd.DataFrame(events, columns=['class', 'classID', 'onset', 'offset', 'score']).to_csv(args.output, index=False)
+    print(f'{len(events)} events in {probs.shape[0] * frame_s:.1f} s of audio, processed in {elapsed:.1f} s '
+          f'({probs.shape[0]} frames of {frame_s * 1000:.0f} ms), saved to {args.output}')
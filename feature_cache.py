@@ -0,0 +1,204 @@
+import copy
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, Subset
+from Classification import AudioUtil
+
+# 特征缓存中各数据类型的存储格式；numpy没有bfloat16，按位存为int16
+STORAGE_DTYPES = {torch.float32: np.float32, torch.float16: np.float16, torch.bfloat16: np.int16}
+
+
+# ----------------------------
+# Deterministic (un-augmented) view of a SoundDS / Subset
+# ----------------------------
+def feature_view(ds):
+    """
+    返回关闭了增强的数据集副本（共享DataFrame，不修改原数据集），可穿过random_split产生的Subset。
+
+    参数:
+    - ds: SoundDS或其Subset。
+
+    返回:
+    - tuple: (关闭增强的数据集, 底层SoundDS副本, 样本在底层数据集中的索引列表)。
+    """
+    if isinstance(ds, Subset):
+        _, base, indices = feature_view(ds.dataset)
+        indices = [indices[i] for i in ds.indices]
+        return Subset(base, indices), base, indices
+    base = copy.copy(ds)
+    base.augment = False
+    return base, base, list(range(len(ds)))
+
+
+def cache_key(ds):
+    """
+    根据样本文件列表和特征参数计算缓存键，参数或样本变化时缓存自动失效。
+    """
+    _, base, indices = feature_view(ds)
+    params = {
+        'paths': base.df.loc[indices, 'relative_path'].tolist(),
+        'duration': base.duration, 'sr': base.sr, 'channel': base.channel,
+        'n_mels': base.n_mels, 'n_fft': base.n_fft, 'hop_len': base.hop_len,
+        'seed': base.seed,
+    }
+    # float32缓存的键保持不变，已有的缓存无需重建
+    dtype = getattr(base, 'feature_dtype', torch.float32)
+    if dtype != torch.float32:
+        params['dtype'] = str(dtype)
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def stored_key(cache_dir):
+    """
+    返回cache_dir中已完成的缓存的键；没有meta.json（不存在或构建不完整）时返回None。
+    """
+    meta_file = Path(cache_dir) / 'meta.json'
+    if not meta_file.exists():
+        return None
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        return json.load(f).get('key')
+
+
+# ----------------------------
+# Build the cache
+# ----------------------------
+def build_feature_cache(ds, cache_dir, batch_size=32, num_workers=0):
+    """
+    计算数据集中每个样本未增强的梅尔频谱图，以数据集的feature_dtype连续写入cache_dir下的
+    features.npy（内存映射），并写入labels.npy和meta.json。先写入临时目录再重命名，多个进程同时构建时不会互相破坏；
+    cache_dir中已有其他参数构建的缓存或不完整的缓存（没有meta.json）时将其替换。
+
+    参数:
+    - ds: SoundDS或其Subset。
+    - cache_dir: 缓存目录。
+    - batch_size: 构建时每批计算的样本数。
+    - num_workers: 构建时DataLoader的worker数量。
+
+    返回:
+    - Path: 缓存目录。
+    """
+    cache_dir = Path(cache_dir)
+    key = cache_key(ds)
+    view, base, _ = feature_view(ds)
+    if len(view) == 0:
+        raise ValueError(f'cannot build a feature cache for an empty dataset ({cache_dir})')
+    dtype = getattr(base, 'feature_dtype', torch.float32)
+    tmp_dir = cache_dir.with_name(f'{cache_dir.name}.tmp-{os.getpid()}')
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    features = None
+    labels = np.empty(len(view), dtype=np.int64)
+    pos = 0
+    for sgrams, class_ids in DataLoader(view, batch_size=batch_size, shuffle=False, num_workers=num_workers):
+        if features is None:
+            features = np.lib.format.open_memmap(tmp_dir / 'features.npy', mode='w+', dtype=STORAGE_DTYPES[dtype],
+                                                 shape=(len(view), *sgrams.shape[1:]))
+        sgrams = sgrams.to(dtype)
+        features[pos:pos + len(sgrams)] = (sgrams.view(torch.int16) if dtype == torch.bfloat16 else sgrams).numpy()
+        labels[pos:pos + len(sgrams)] = class_ids.numpy()
+        pos += len(sgrams)
+    features.flush()
+    del features
+    np.save(tmp_dir / 'labels.npy', labels)
+    with open(tmp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'num_items': len(view), 'dtype': str(dtype).replace('torch.', '')}, f)
+
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        if stored_key(cache_dir) == key:
+            # 其他进程已经构建好了同一个缓存
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        else:
+            # 以其他参数构建的旧缓存，或不完整的缓存目录（完整的缓存总是连同meta.json一起重命名而来）
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            os.rename(tmp_dir, cache_dir)
+    return cache_dir
+
+
+def load_or_build_feature_cache(ds, cache_dir, **kwargs):
+    """
+    若cache_dir中已有与ds匹配的缓存则直接使用，否则（重新）构建。
+
+    返回:
+    - Path: 缓存目录。
+    """
+    cache_dir = Path(cache_dir)
+    if stored_key(cache_dir) == cache_key(ds):
+        return cache_dir
+    return build_feature_cache(ds, cache_dir, **kwargs)
+
+
+# ----------------------------
+# Dataset reading from the cache
+# ----------------------------
+class CachedSoundDS(Dataset):
+    """
+    CachedSoundDS从特征缓存中读取梅尔频谱图，免去解码、重采样和频谱计算。
+    features.npy以内存映射方式打开，多个DataLoader worker或多个进程共享操作系统的页缓存。
+    样本保持缓存的数据类型（float32/float16/bfloat16）穿过DataLoader，由模型在输入处转换为float32。
+
+    参数:
+    - cache_dir: build_feature_cache生成的缓存目录。
+    - augment: 是否在频谱图上进行增强（沿时间轴循环移位 + 时间/频率屏蔽）。
+    - shift_pct, max_mask_pct, n_freq_masks, n_time_masks: 增强参数，含义与SoundDS相同。
+    - seed: 全局随机种子，含义与SoundDS相同。
+    """
+    def __init__(self, cache_dir, augment=False, shift_pct=0.4, max_mask_pct=0.1, n_freq_masks=2,
+                 n_time_masks=2, seed=None):
+        self.cache_dir = Path(cache_dir)
+        self.labels = np.load(self.cache_dir / 'labels.npy')
+        with open(self.cache_dir / 'meta.json', 'r', encoding='utf-8') as f:
+            self.dtype = getattr(torch, json.load(f).get('dtype', 'float32'))
+        self.augment = augment
+        self.shift_pct = shift_pct
+        self.max_mask_pct = max_mask_pct
+        self.n_freq_masks = n_freq_masks
+        self.n_time_masks = n_time_masks
+        self.seed = seed
+        self.epoch = 0
+        self._features = None
+
+    @property
+    def features(self):
+        # 延迟打开，避免把内存映射对象传给worker进程
+        if self._features is None:
+            self._features = np.load(self.cache_dir / 'features.npy', mmap_mode='r')
+        return self._features
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_features'] = None
+        return state
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        return self.get_item(idx, self.epoch)
+
+    def get_item(self, idx, epoch):
+        sgram = torch.from_numpy(np.array(self.features[idx]))
+        if self.dtype == torch.bfloat16:
+            sgram = sgram.view(torch.bfloat16)
+        class_id = int(self.labels[idx])
+        if not self.augment:
+            return sgram, class_id
+
+        gen = None if self.seed is None else AudioUtil.make_generator(self.seed, epoch, idx)
+        # 在频谱图上做时间移位，近似于对波形做time_shift
+        shift_amt = int(float(torch.rand(1, generator=gen)) * self.shift_pct * sgram.shape[-1])
+        sgram = sgram.roll(shift_amt, dims=-1)
+        # roll已经产生了新的张量，原地屏蔽即可
+        aug_sgram = AudioUtil.spectro_augment(sgram, max_mask_pct=self.max_mask_pct, n_freq_masks=self.n_freq_masks,
+                                              n_time_masks=self.n_time_masks, generator=gen, inplace=True)
+        return aug_sgram, class_id
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 配置参数
+CACHE_PATH = "llm_cache.sqlite"  # 两个问答生成脚本共用的缓存数据库
+MAX_CACHE_MB = 1024  # 缓存中补全文本的总大小上限，超过后按最近最少使用淘汰
+EVICT_TO = 0.9  # 淘汰到上限的这个比例，避免每次写入都触发淘汰
+MODEL_CONFIG_FILES = ("config.json", "generation_config.json")  # 计算本地模型标识时哈希其内容的文件
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".gguf")  # 权重文件只记录名称、大小和修改时间，不读取内容
+
+def prompt_hash(prompt):
+    """提示的内容哈希（提示可以是字符串，也可以是chat消息等可JSON序列化的对象）"""
+    if not isinstance(prompt, str):
+        prompt = json.dumps(prompt, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+def model_identity(model):
+    """模型标识：本地模型目录为配置文件内容与权重文件（名称、大小、修改时间）的哈希，在同一路径替换权重后
+    标识随之改变；其他情况（如服务端的模型名）原样返回"""
+    if not os.path.isdir(model):
+        return model
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(model)):
+        path = os.path.join(model, name)
+        if name in MODEL_CONFIG_FILES:
+            with open(path, 'rb') as f:
+                digest.update(name.encode('utf-8') + f.read())
+        elif name.endswith(WEIGHT_SUFFIXES):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    return f"{model}@{digest.hexdigest()[:16]}"
+
+def cache_key(model, prompt, temperature=None, top_p=None, max_tokens=None, seed=None):
+    """缓存键：由模型、提示哈希和采样参数共同决定，任一项变化都视为不同的请求"""
+    key = json.dumps([model, prompt_hash(prompt), temperature, top_p, max_tokens, seed])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+class LLMCache:
+    """以SQLite保存LLM原始补全文本的内容寻址缓存，按总大小做LRU淘汰，并统计命中率
+
+    refresh=True时不读取缓存（重新生成），但仍写入新的补全结果。连接可在多个线程间共用（如asyncio.to_thread），
+    各操作由锁串行化。
+    """
+    def __init__(self, path=CACHE_PATH, max_mb=MAX_CACHE_MB, refresh=False):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_mb * 2**20)
+        self.refresh = refresh
+        self.hits = self.misses = 0
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # 允许多个进程同时读写
+        self.conn.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, model TEXT, "
+                          "completion TEXT, size INTEGER, created REAL, last_used REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+        self.conn.commit()
+        self.total_bytes = self._stored_bytes()
+
+    def _stored_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def get_many(self, keys):
+        """返回{键: 补全文本}，只包含命中的键，并更新其最近使用时间"""
+        found = {}
+        with self.lock:
+            if not self.refresh:
+                for start in range(0, len(keys), 500):  # SQLite对单条语句的参数个数有限制
+                    batch = keys[start:start + 500]
+                    rows = self.conn.execute(f"SELECT key, completion FROM completions WHERE key IN "
+                                             f"({','.join('?' * len(batch))})", batch).fetchall()
+                    found.update(rows)
+                if found:
+                    now = time.time()
+                    self.conn.executemany("UPDATE completions SET last_used = ? WHERE key = ?",
+                                          [(now, key) for key in found])
+                    self.conn.commit()
+            hits = sum(key in found for key in keys)  # 同一批中重复的键按次数统计
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items, model=None):
+        """写入{键: 补全文本}，总大小超过上限时淘汰最近最少使用的条目"""
+        now = time.time()
+        rows = [(key, model, completion, len(completion.encode('utf-8')), now, now)
+                for key, completion in items.items()]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+            self.total_bytes += sum(row[3] for row in rows)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def put(self, key, completion, model=None):
+        self.put_many({key: completion}, model)
+
+    def evict(self):
+        """按最近使用时间从旧到新删除条目，直到总大小降到上限的EVICT_TO"""
+        with self.lock:
+            self.total_bytes = self._stored_bytes()  # 其他进程也可能写入过
+            if self.total_bytes <= self.max_bytes:
+                return 0
+            excess = self.total_bytes - int(self.max_bytes * EVICT_TO)
+            victims, freed = [], 0
+            for key, size in self.conn.execute("SELECT key, size FROM completions ORDER BY last_used"):
+                victims.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            self.conn.executemany("DELETE FROM completions WHERE key = ?", victims)
+            self.conn.commit()
+            self.total_bytes -= freed
+        return len(victims)
+
+    def stats(self):
+        """命中率和缓存大小"""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries, "mb": self.total_bytes / 2**20}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from aiohttp import web
+
+# Configuration
+PORT = 8000
+LATENCY = 0.5  # Seconds per completion, independent of how many requests are batched together
+BATCH_CAPACITY = 16  # Requests the mock "GPU" processes at once; further requests queue
+MAX_QUEUE = 256  # Requests waiting beyond this are rejected with 429
+ERROR_RATE = 0.0  # Fraction of requests failing with a random 429/500/503
+
+
+def mock_completion(prompt):
+    """Deterministic QA pairs built from the beginning and end of the input text"""
+    text = prompt.split("Input Text:")[-1].split("Output MUST")[0].strip()
+    qa_pairs = [{"question": f"What does the text say about {text[:20]!r}?", "answer": f"It says {text[-40:]!r}."}]
+    return json.dumps({"qa_pairs": qa_pairs}, ensure_ascii=False)
+
+
+def create_app(latency=LATENCY, batch_capacity=BATCH_CAPACITY, max_queue=MAX_QUEUE, error_rate=ERROR_RATE):
+    """
+    OpenAI-compatible /v1/chat/completions endpoint that behaves like a batching inference server:
+    up to batch_capacity requests are served concurrently, each taking `latency` seconds
+    """
+    slots = asyncio.Semaphore(batch_capacity)
+    stats = {"requests": 0, "completed": 0, "errors": 0, "rejected": 0, "waiting": 0, "max_in_flight": 0,
+             "in_flight": 0, "started": time.perf_counter()}
+
+    async def chat_completions(request):
+        payload = await request.json()
+        stats["requests"] += 1
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            status = random.choice([429, 500, 503])
+            return web.json_response({"error": {"message": "injected failure"}}, status=status,
+                                     headers={"Retry-After": "0.1"} if status == 429 else None)
+        if stats["waiting"] >= max_queue:
+            stats["rejected"] += 1
+            return web.json_response({"error": {"message": "queue full"}}, status=429)
+        stats["waiting"] += 1
+        async with slots:
+            stats["waiting"] -= 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            await asyncio.sleep(latency)
+            stats["in_flight"] -= 1
+        stats["completed"] += 1
+        content = mock_completion(payload["messages"][-1]["content"])
+        return web.json_response({"id": f"mock-{stats['requests']}", "object": "chat.completion",
+                                  "model": payload.get("model"),
+                                  "choices": [{"index": 0, "finish_reason": "stop",
+                                               "message": {"role": "assistant", "content": content}}]})
+
+    async def get_stats(request):
+        elapsed = time.perf_counter() - stats["started"]
+        return web.json_response({**stats, "completed_per_s": stats["completed"] / elapsed})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI-compatible QA generation API")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--batch-capacity", type=int, default=BATCH_CAPACITY)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.latency, args.batch_capacity, args.max_queue, args.error_rate), port=args.port)
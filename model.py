@@ -1,9 +1,10 @@
+import copy
+import math
+import time
 import torch
 from torch.nn import init
 import torch.nn as nn
 import torch.nn.functional as F
-from dataset_us8k import train_dl
-from dataset_us8k import val_dl
 # ----------------------------
 # Audio Classification Model
 # ----------------------------
@@ -11,61 +12,66 @@ class AudioClassifier (nn.Module):
     # ----------------------------
     # Build the model architecture
     # ----------------------------
-    def __init__(self):
+    # channels: output channels of each convolution block; its length is the
+    #   depth (every block halves both spatial dimensions)
+    # separable: use a depthwise + pointwise (1x1) pair instead of a full
+    #   convolution in every block
+    def __init__(self, channels=(8, 16, 32, 64), separable=False):
         # 调用父类的构造方法，初始化对象
         super().__init__()
         ## 初始化一个空列表，用于存储卷积层
         conv_layers = []
 
-        # First Convolution Block with Relu and Batch Norm. Use Kaiming Initialization
-        self.conv1 = nn.Conv2d(2, 8, kernel_size=(5, 5), stride=(2, 2), padding=(2, 2))
-        self.relu1 = nn.ReLU()
-        self.bn1 = nn.BatchNorm2d(8)
-        init.kaiming_normal_(self.conv1.weight, a=0.1)
-        self.conv1.bias.data.zero_()
-        conv_layers += [self.conv1, self.relu1, self.bn1]
-
-        # Second Convolution Block
-        self.conv2 = nn.Conv2d(8, 16, kernel_size=(3, 3), stride=(2, 2), padding=(1, 1))
-        self.relu2 = nn.ReLU()
-        self.bn2 = nn.BatchNorm2d(16)
-        init.kaiming_normal_(self.conv2.weight, a=0.1)
-        self.conv2.bias.data.zero_()
-        conv_layers += [self.conv2, self.relu2, self.bn2]
-
-        # Second Convolution Block
-        self.conv3 = nn.Conv2d(16, 32, kernel_size=(3, 3), stride=(2, 2), padding=(1, 1))
-        self.relu3 = nn.ReLU()
-        self.bn3 = nn.BatchNorm2d(32)
-        init.kaiming_normal_(self.conv3.weight, a=0.1)
-        self.conv3.bias.data.zero_()
-        conv_layers += [self.conv3, self.relu3, self.bn3]
-
-        # Second Convolution Block
-        self.conv4 = nn.Conv2d(32, 64, kernel_size=(3, 3), stride=(2, 2), padding=(1, 1))
-        self.relu4 = nn.ReLU()
-        self.bn4 = nn.BatchNorm2d(64)
-        init.kaiming_normal_(self.conv4.weight, a=0.1)
-        self.conv4.bias.data.zero_()
-        conv_layers += [self.conv4, self.relu4, self.bn4]
+        # Convolution Blocks with Relu and Batch Norm. Use Kaiming Initialization.
+        # The first block uses a 5x5 kernel, the others 3x3. Block i is exposed as
+        # conv<i>/relu<i>/bn<i> (and dw<i> for the depthwise part when separable)
+        in_channels = 2
+        for i, out_channels in enumerate(channels, 1):
+            k, p = (5, 2) if i == 1 else (3, 1)
+            if separable:
+                dw = nn.Conv2d(in_channels, in_channels, kernel_size=(k, k), stride=(2, 2), padding=(p, p),
+                               groups=in_channels, bias=False)
+                init.kaiming_normal_(dw.weight, a=0.1)
+                conv = nn.Conv2d(in_channels, out_channels, kernel_size=(1, 1))
+                setattr(self, f'dw{i}', dw)
+                conv_layers += [dw]
+            else:
+                conv = nn.Conv2d(in_channels, out_channels, kernel_size=(k, k), stride=(2, 2), padding=(p, p))
+            relu = nn.ReLU()
+            bn = nn.BatchNorm2d(out_channels)
+            init.kaiming_normal_(conv.weight, a=0.1)
+            conv.bias.data.zero_()
+            setattr(self, f'conv{i}', conv)
+            setattr(self, f'relu{i}', relu)
+            setattr(self, f'bn{i}', bn)
+            conv_layers += [conv, relu, bn]
+            in_channels = out_channels
 
         # Linear Classifier
         self.ap = nn.AdaptiveAvgPool2d(output_size=1)
-        self.lin = nn.Linear(in_features=64, out_features=10)
+        self.lin = nn.Linear(in_features=in_channels, out_features=10)
 
         # Wrap the Convolutional Blocks
         self.conv = nn.Sequential(*conv_layers)
 
     # ----------------------------
-    # Forward pass computations
+    # Pooled embedding (the input of the linear classifier)
     # ----------------------------
-    def forward(self, x):
+    def embed(self, x):
         # Run the convolutional blocks
         x = self.conv(x)
 
         # Adaptive pool and flatten for input to linear layer
         x = self.ap(x)
         x = x.view(x.shape[0], -1)
+        return x
+
+    # ----------------------------
+    # Forward pass computations
+    # ----------------------------
+    def forward(self, x):
+        # Pooled embedding
+        x = self.embed(x)
 
         # Linear layer
         x = self.lin(x)
@@ -73,51 +79,255 @@ class AudioClassifier (nn.Module):
         # Final output
         return x
 
-# Create the model and put it on the GPU if available
-myModel = AudioClassifier()
+# ----------------------------
+# Named model size variants
+# ----------------------------
+# width_mult scales the 8/16/32/64 channel progression, depth sets the number
+# of blocks (channels keep doubling), separable switches to depthwise-separable
+# blocks. 'base' is the original AudioClassifier.
+MODEL_VARIANTS = {
+    'micro': dict(width_mult=0.5, depth=3, separable=True),
+    'tiny': dict(width_mult=0.5, depth=4),
+    'small_sep': dict(width_mult=1.0, depth=4, separable=True),
+    'base': dict(width_mult=1.0, depth=4),
+    'wide_sep': dict(width_mult=2.0, depth=4, separable=True),
+    'wide': dict(width_mult=2.0, depth=4),
+    'deep': dict(width_mult=1.0, depth=5),
+    'large': dict(width_mult=4.0, depth=5),
+}
+
+def variant_channels(width_mult=1.0, depth=4):
+    return tuple(max(4, int(round(8 * width_mult * 2 ** i))) for i in range(depth))
+
+def build_model(name='base'):
+    cfg = MODEL_VARIANTS[name]
+    return AudioClassifier(channels=variant_channels(cfg['width_mult'], cfg['depth']),
+                           separable=cfg.get('separable', False))
+
+# ----------------------------
+# Architecture-aware checkpoint loading
+# ----------------------------
+# Accepts a plain state_dict of any variant (the per-block channels are read
+# from the BatchNorm shapes, separable from the depthwise weights) or a
+# pruning.checkpoint() dict that records the architecture explicitly
+def classifier_from_state(state):
+    if 'state_dict' in state:
+        model = AudioClassifier(channels=tuple(state['channels']), separable=state['separable'])
+        state = state['state_dict']
+    else:
+        channels = []
+        while f'bn{len(channels) + 1}.weight' in state:
+            channels.append(state[f'bn{len(channels) + 1}.weight'].shape[0])
+        model = AudioClassifier(channels=tuple(channels), separable='dw1.weight' in state)
+    model.load_state_dict(state)
+    return model
+
+def load_classifier(checkpoint):
+    return classifier_from_state(torch.load(checkpoint, map_location=device)).to(device).eval()
+
+# ----------------------------
+# Per-frame multi-label event detection head
+# ----------------------------
+class EventDetector (nn.Module):
+    # Keeps the time axis after the AudioClassifier conv stack: frequency is
+    # averaged away and a 1D convolution emits per-frame class logits, so one
+    # forward pass over a long spectrogram yields [batch, frames, classes].
+    # The conv stack downsamples time by 16, i.e. one output frame per 16
+    # spectrogram frames.
+    def __init__(self, backbone=None, num_classes=10, kernel_size=3):
+        super().__init__()
+        self.backbone = AudioClassifier() if backbone is None else backbone
+        in_channels = self.backbone.lin.in_features
+        self.head = nn.Conv1d(in_channels, num_classes, kernel_size=kernel_size, padding=kernel_size // 2)
+
+    # ----------------------------
+    # Start from a trained clip classifier: a kernel-1 head copied from its
+    # linear layer gives clip logits (mean over frames) identical to the
+    # classifier's, before any frame-level fine-tuning. This is only a
+    # heuristic starting point: the head was trained with softmax
+    # cross-entropy, so its per-class sigmoids are not calibrated
+    # probabilities until fine-tuned with train_event_detector()
+    # ----------------------------
+    @classmethod
+    def from_classifier(cls, classifier):
+        detector = cls(backbone=classifier, num_classes=classifier.lin.out_features, kernel_size=1)
+        with torch.no_grad():
+            detector.head.weight.copy_(classifier.lin.weight.unsqueeze(-1))
+            detector.head.bias.copy_(classifier.lin.bias)
+        return detector
+
+    def forward(self, x):
+        # [batch, channels, freq, time] -> [batch, channels, time]
+        x = self.backbone.conv(x).mean(dim=2)
+        # [batch, classes, time] -> [batch, time, classes]
+        return self.head(x).transpose(1, 2)
+
+    # Clip-level logits for training with weak (clip) labels
+    def clip_logits(self, x):
+        return self.forward(x).mean(dim=1)
+
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-myModel = myModel.to(device)
-# Check that it is on Cuda
-next(myModel.parameters()).device
+
+# Batch size at which the default max_lr was tuned; the learning rate is scaled
+# linearly with the effective batch size (micro-batch size * accumulation steps)
+BASE_BATCH_SIZE = 16
+
+def scaled_lr(max_lr, batch_size, accum_steps=1, base_batch_size=BASE_BATCH_SIZE):
+  return max_lr * batch_size * accum_steps / base_batch_size
+
+def optimizer_steps_per_epoch(train_dl, accum_steps=1):
+  # The last, shorter group of micro-batches of an epoch still takes an optimizer step
+  return math.ceil(len(train_dl) / accum_steps)
+
+# ----------------------------
+# Propagate the epoch to the underlying SoundDS
+# ----------------------------
+def set_epoch(dl, epoch):
+    """
+    在每个epoch开始前调用，将epoch传递给DataLoader背后的数据集（可穿过random_split产生的Subset）。
+
+    参数:
+    - dl: DataLoader、PrefetchLoader或数据集。
+    - epoch: 训练轮次。
+    """
+    ds = dl
+    while not hasattr(ds, 'set_epoch') and hasattr(ds, 'dataset'):
+        ds = ds.dataset
+    if hasattr(ds, 'set_epoch'):
+        ds.set_epoch(epoch)
+    # 带种子的采样器（ClassBalancedSampler等）每个epoch也重新抽样
+    sampler = getattr(dl, 'sampler', None)
+    if hasattr(sampler, 'set_epoch'):
+        sampler.set_epoch(epoch)
+
+# ----------------------------
+# Input normalization shared by training, evaluation and inference
+# ----------------------------
+# Each spectrogram is standardized on its own, so a model output depends only
+# on its input clip, not on the batch it was in (training, validation,
+# embedding extraction, batch classification and cached teacher logits all
+# see the same input distribution). The std is floored for silent clips
+def normalize_inputs(inputs):
+  dims = tuple(range(1, inputs.dim()))
+  return (inputs - inputs.mean(dim=dims, keepdim=True)) / inputs.std(dim=dims, keepdim=True).clamp_min(1e-5)
+
+# ----------------------------
+# Validation loss and accuracy
+# ----------------------------
+def evaluate(model, val_dl):
+  criterion = nn.CrossEntropyLoss(reduction='sum')
+  total_loss = 0.0
+  correct_prediction = 0
+  total_prediction = 0
+
+  # Use running BatchNorm statistics and disable gradient updates
+  was_training = model.training
+  model.eval()
+  with torch.no_grad():
+    for data in val_dl:
+      # Features may be stored as float16/bfloat16; upcast at the model input
+      inputs, labels = data[0].to(device, torch.float32), data[1].to(device)
+
+      # Normalize the inputs
+      inputs = normalize_inputs(inputs)
+
+      outputs = model(inputs)
+      total_loss += criterion(outputs, labels).item()
+      _, prediction = torch.max(outputs,1)
+      correct_prediction += (prediction == labels).sum().item()
+      total_prediction += prediction.shape[0]
+  model.train(was_training)
+
+  return total_loss/total_prediction, correct_prediction/total_prediction
 
 # Training Loop
 # ----------------------------
-def training(model, train_dl, num_epochs):
+# val_dl: evaluated every val_every epochs (use cached features to keep it cheap)
+# patience: stop after this many validations without a new best accuracy
+# max_minutes: wall-clock budget, checked after every batch
+# checkpoint_path: where the best weights are saved; they are also restored into
+#   the model when training ends
+# max_lr: peak learning rate of the OneCycleLR schedule
+# start_epoch, optimizer, scheduler: resume a run (e.g. a sweep trial) at
+#   start_epoch with an existing optimizer and schedule built for num_epochs
+# distill_alpha, temperature: when batches carry teacher logits as a third
+#   element, the loss is (1 - alpha) * CE + alpha * T^2 * KL(teacher || student)
+# accum_steps: accumulate gradients over this many micro-batches of train_dl per
+#   optimizer step, so the effective batch is train_dl.batch_size * accum_steps
+#   (BatchNorm still sees one micro-batch at a time)
+# base_batch_size: when the optimizer is created here, max_lr is scaled by
+#   effective batch / base_batch_size (linear scaling rule; None disables it).
+#   The OneCycleLR warm-up ramps up to the scaled rate
+# Returns one dict of metrics per epoch
+def training(model, train_dl, num_epochs, val_dl=None, val_every=1, patience=None,
+             max_minutes=None, checkpoint_path=None, max_lr=0.001, start_epoch=0,
+             optimizer=None, scheduler=None, distill_alpha=0.0, temperature=4.0,
+             accum_steps=1, base_batch_size=BASE_BATCH_SIZE):
   # Loss Function, Optimizer and Scheduler
-  criterion = nn.CrossEntropyLoss()
-  optimizer = torch.optim.Adam(model.parameters(),lr=0.001)
-  scheduler = torch.optim.lr_scheduler.OneCycleLR(optimizer, max_lr=0.001,
-                                                steps_per_epoch=int(len(train_dl)),
-                                                epochs=num_epochs,
-                                                anneal_strategy='linear')
+  # Per-sample losses are kept so a HardExampleSampler can re-weight the data
+  criterion = nn.CrossEntropyLoss(reduction='none')
+  sampler = getattr(train_dl, 'sampler', None)
+  track_losses = hasattr(sampler, 'update')
+  if optimizer is None:
+    if base_batch_size is not None:
+      max_lr = scaled_lr(max_lr, train_dl.batch_size, accum_steps, base_batch_size)
+    optimizer = torch.optim.Adam(model.parameters(),lr=max_lr)
+  if scheduler is None:
+    # The schedule advances once per optimizer step, not once per micro-batch
+    scheduler = torch.optim.lr_scheduler.OneCycleLR(optimizer, max_lr=max_lr,
+                                                  steps_per_epoch=optimizer_steps_per_epoch(train_dl, accum_steps),
+                                                  epochs=num_epochs,
+                                                  anneal_strategy='linear')
+
+  deadline = None if max_minutes is None else time.monotonic() + max_minutes * 60
+  best_acc, best_state, bad_rounds = -1.0, None, 0
+  history = []
+  stop = False
 
   # Repeat for each epoch
-  for epoch in range(num_epochs):
+  for epoch in range(start_epoch, num_epochs):
+    # Derive this epoch's per-sample augmentation RNG from (seed, epoch, index)
+    set_epoch(train_dl, epoch)
+    model.train()
     running_loss = 0.0
     correct_prediction = 0
     total_prediction = 0
+    num_batches = 0
+    n_micro = len(train_dl)
 
     # Repeat for each batch in the training set
     for i, data in enumerate(train_dl):
         # Get the input features and target labels, and put them on the GPU
-        inputs, labels = data[0].to(device), data[1].to(device)
+        # (float16/bfloat16 features are upcast to float32 here)
+        inputs, labels = data[0].to(device, torch.float32), data[1].to(device)
 
         # Normalize the inputs
-        inputs_m, inputs_s = inputs.mean(), inputs.std()
-        inputs = (inputs - inputs_m) / inputs_s
+        inputs = normalize_inputs(inputs)
 
-        # Zero the parameter gradients
-        optimizer.zero_grad()
+        # Zero the parameter gradients at the start of each accumulation group
+        group_start = i - i % accum_steps
+        if i == group_start:
+          optimizer.zero_grad()
 
         # forward + backward + optimize
         outputs = model(inputs)
-        loss = criterion(outputs, labels)
-        loss.backward()
-        optimizer.step()
-        scheduler.step()
+        sample_losses = criterion(outputs, labels)
+        if distill_alpha > 0 and len(data) > 2:
+          teacher_logits = data[2].to(device)
+          kl = F.kl_div(F.log_softmax(outputs / temperature, dim=1), F.log_softmax(teacher_logits / temperature, dim=1),
+                        reduction='none', log_target=True).sum(dim=1)
+          sample_losses = (1 - distill_alpha) * sample_losses + distill_alpha * temperature ** 2 * kl
+        loss = sample_losses.mean()
+        # Average over the micro-batches of the group (the last group of an epoch may be shorter)
+        (loss / min(accum_steps, n_micro - group_start)).backward()
+        if i + 1 == n_micro or (i + 1) % accum_steps == 0:
+          optimizer.step()
+          scheduler.step()
 
         # Keep stats for Loss and Accuracy
         running_loss += loss.item()
+        if track_losses:
+          sampler.update(sampler.batch_indices(i, train_dl.batch_size), sample_losses)
 
         # Get the predicted class with the highest score
         _, prediction = torch.max(outputs,1)
@@ -125,45 +335,139 @@ def training(model, train_dl, num_epochs):
         correct_prediction += (prediction == labels).sum().item()
         total_prediction += prediction.shape[0]
 
+        num_batches += 1
+
         #if i % 10 == 0:    # print every 10 mini-batches
         #    print('[%d, %5d] loss: %.3f' % (epoch + 1, i + 1, running_loss / 10))
 
+        # Time budget exhausted
+        if deadline is not None and time.monotonic() > deadline:
+          print(f'Time budget of {max_minutes} minutes reached')
+          stop = True
+          break
+
     # Print stats at the end of the epoch
-    num_batches = len(train_dl)
-    avg_loss = running_loss / num_batches
-    acc = correct_prediction/total_prediction
+    avg_loss = running_loss / max(num_batches, 1)
+    acc = correct_prediction/max(total_prediction, 1)
     print(f'Epoch: {epoch}, Loss: {avg_loss:.2f}, Accuracy: {acc:.2f}')
+    stats = {'epoch': epoch, 'loss': avg_loss, 'acc': acc}
 
-  print('Finished Training')
+    # Periodic validation, best-checkpoint retention and early stopping
+    last_epoch = stop or epoch == num_epochs - 1
+    if val_dl is not None and ((epoch + 1) % val_every == 0 or last_epoch):
+      val_loss, val_acc = evaluate(model, val_dl)
+      stats.update(val_loss=val_loss, val_acc=val_acc)
+      print(f'Epoch: {epoch}, Val Loss: {val_loss:.2f}, Val Accuracy: {val_acc:.2f}')
+      if val_acc > best_acc:
+        best_acc, bad_rounds = val_acc, 0
+        best_state = copy.deepcopy(model.state_dict())
+        if checkpoint_path is not None:
+          torch.save(best_state, checkpoint_path)
+      else:
+        bad_rounds += 1
+        if patience is not None and bad_rounds >= patience:
+          print(f'Early stopping: no improvement in {patience} validations')
+          stop = True
+    history.append(stats)
 
-num_epochs=100# Just for demo, adjust this higher.
-training(myModel, train_dl, num_epochs)
+    if stop:
+      break
 
-def inference (model, val_dl):
-  correct_prediction = 0
-  total_prediction = 0
+  # Keep the best weights seen during validation
+  if best_state is not None:
+    model.load_state_dict(best_state)
+    print(f'Restored best model, Val Accuracy: {best_acc:.2f}')
+
+  print('Finished Training')
+  return history
 
-  # Disable gradient updates
+# ----------------------------
+# Multi-label training of an EventDetector
+# ----------------------------
+# Weak (clip-level) labels: the clip logits (mean of the frame logits) are
+# trained with BCEWithLogits, one independent sigmoid per class. Labels may
+# be class IDs (turned into one-hot targets) or multi-hot [batch, classes]
+# tensors. With val_dl the weights with the lowest validation loss are kept
+# (and saved to checkpoint_path). Returns one dict of metrics per epoch
+def clip_targets(labels, num_classes):
+  if labels.dim() == 1:
+    return F.one_hot(labels, num_classes).float()
+  return labels.float()
+
+def evaluate_event_detector(detector, val_dl):
+  criterion = nn.BCEWithLogitsLoss(reduction='sum')
+  num_classes = detector.head.out_channels
+  total_loss, total_items = 0.0, 0
+  was_training = detector.training
+  detector.eval()
   with torch.no_grad():
     for data in val_dl:
-      # Get the input features and target labels, and put them on the GPU
-      inputs, labels = data[0].to(device), data[1].to(device)
+      inputs, labels = data[0].to(device, torch.float32), data[1].to(device)
+      inputs = normalize_inputs(inputs)
+      total_loss += criterion(detector.clip_logits(inputs), clip_targets(labels, num_classes)).item()
+      total_items += inputs.shape[0] * num_classes
+  detector.train(was_training)
+  return total_loss / total_items
 
-      # Normalize the inputs
-      inputs_m, inputs_s = inputs.mean(), inputs.std()
-      inputs = (inputs - inputs_m) / inputs_s
+def train_event_detector(detector, train_dl, num_epochs, val_dl=None, checkpoint_path=None, max_lr=0.001):
+  criterion = nn.BCEWithLogitsLoss()
+  num_classes = detector.head.out_channels
+  optimizer = torch.optim.Adam(detector.parameters(), lr=max_lr)
+  scheduler = torch.optim.lr_scheduler.OneCycleLR(optimizer, max_lr=max_lr, steps_per_epoch=len(train_dl),
+                                                  epochs=num_epochs, anneal_strategy='linear')
+  best_loss, best_state = None, None
+  history = []
+  for epoch in range(num_epochs):
+    set_epoch(train_dl, epoch)
+    detector.train()
+    running_loss, num_batches = 0.0, 0
+    for data in train_dl:
+      inputs, labels = data[0].to(device, torch.float32), data[1].to(device)
+      inputs = normalize_inputs(inputs)
+      optimizer.zero_grad()
+      loss = criterion(detector.clip_logits(inputs), clip_targets(labels, num_classes))
+      loss.backward()
+      optimizer.step()
+      scheduler.step()
+      running_loss += loss.item()
+      num_batches += 1
+    stats = {'epoch': epoch, 'loss': running_loss / max(num_batches, 1)}
+    print(f'Epoch: {epoch}, BCE Loss: {stats["loss"]:.4f}')
+    if val_dl is not None:
+      stats['val_loss'] = evaluate_event_detector(detector, val_dl)
+      print(f'Epoch: {epoch}, Val BCE Loss: {stats["val_loss"]:.4f}')
+      if best_loss is None or stats['val_loss'] < best_loss:
+        best_loss, best_state = stats['val_loss'], copy.deepcopy(detector.state_dict())
+    history.append(stats)
 
-      # Get predictions
-      outputs = model(inputs)
+  if best_state is not None:
+    detector.load_state_dict(best_state)
+    print(f'Restored best detector, Val BCE Loss: {best_loss:.4f}')
+  if checkpoint_path is not None:
+    torch.save(detector.state_dict(), checkpoint_path)
+  return history
 
-      # Get the predicted class with the highest score
-      _, prediction = torch.max(outputs,1)
-      # Count of predictions that matched the target label
-      correct_prediction += (prediction == labels).sum().item()
-      total_prediction += prediction.shape[0]
+def inference (model, val_dl):
+  _, acc = evaluate(model, val_dl)
+  print(f'Accuracy: {acc:.2f}, Total items: {len(val_dl.dataset)}')
+
+if __name__ == "__main__":
+  from torch.utils.data import DataLoader
+  from dataset_us8k import train_dl, val_dl, val_ds, FEATURE_CACHE_DIR, ACCUM_STEPS
+  from feature_cache import CachedSoundDS, load_or_build_feature_cache
+
+  # Create the model and put it on the GPU if available
+  myModel = AudioClassifier()
+  myModel = myModel.to(device)
+
+  # Validation spectrograms are deterministic, so compute them once and reuse
+  # them for every periodic validation
+  val_cache_dl = DataLoader(CachedSoundDS(load_or_build_feature_cache(val_ds, FEATURE_CACHE_DIR/'val')),
+                            batch_size=64, shuffle=False)
 
-  acc = correct_prediction/total_prediction
-  print(f'Accuracy: {acc:.2f}, Total items: {total_prediction}')
+  num_epochs=100# Just for demo, adjust this higher.
+  training(myModel, train_dl, num_epochs, val_dl=val_cache_dl, val_every=1, patience=10,
+           max_minutes=None, checkpoint_path='best_model.pt', accum_steps=ACCUM_STEPS)
 
-# Run inference on trained model with the validation set
-inference(myModel, val_dl)
\ No newline at end of file
+  # Run inference on trained model with the validation set
+  inference(myModel, val_dl)
\ No newline at end of file
@@ -0,0 +1,202 @@
+import math
+import queue
+import threading
+import traceback
+
+import torch
+import torch.multiprocessing as mp
+from torch.utils.data import Subset
+
+
+# ----------------------------
+# Producer process: compute samples into the shared ring buffer
+# ----------------------------
+def _producer(dataset, task_q, ready_q, buf, labels):
+    """
+    后台生产者进程：从任务队列取出(pos, epoch, idx, slot)，计算增强后的声谱图并写入共享内存中的槽位。
+
+    参数:
+    - dataset: 提供get_item(idx, epoch)的数据集（如SoundDS）。
+    - task_q: 任务队列，收到None时退出。
+    - ready_q: 完成队列，写入已完成的位置或错误信息。
+    - buf: 共享内存中的样本缓冲区，形状为[n_slots, *sample_shape]。
+    - labels: 共享内存中的标签缓冲区，形状为[n_slots]。
+    """
+    torch.set_num_threads(1)
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        pos, epoch, idx, slot = task
+        try:
+            sgram, class_id = dataset.get_item(idx, epoch)
+            buf[slot].copy_(sgram)
+            labels[slot] = int(class_id)
+            ready_q.put(pos)
+        except Exception:
+            ready_q.put(('error', traceback.format_exc()))
+
+
+# ----------------------------
+# Prefetching loader
+# ----------------------------
+class PrefetchLoader():
+    """
+    PrefetchLoader在训练当前epoch的同时，由后台进程池提前计算后续样本（包括下一个epoch）的增强声谱图，
+    写入共享内存环形缓冲区，训练循环只需从缓冲区拷贝出批次。可替代train_dl直接传给model.training。
+
+    样本的增强由SoundDS的(seed, epoch, idx)决定，每个epoch的打乱顺序由(seed, epoch)决定，
+    因此提前计算的结果与即时计算完全一致。
+
+    参数:
+    - dataset: SoundDS或其Subset（如random_split得到的train_ds），需提供get_item(idx, epoch)。
+    - batch_size: 每个批次的样本数量。
+    - shuffle: 是否在每个epoch打乱顺序。
+    - seed: 打乱顺序使用的随机种子。
+    - num_workers: 生产者进程数量。
+    - max_memory_mb: 环形缓冲区的内存上限（MB），决定最多可提前计算多少个样本（背压）。
+
+    属性:
+    - n_slots: 环形缓冲区的槽位数。
+    - epoch: 当前epoch，通过set_epoch更新。
+    """
+    def __init__(self, dataset, batch_size=16, shuffle=True, seed=0, num_workers=2, max_memory_mb=512):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_workers = num_workers
+        self.epoch = 0
+
+        # 解析Subset，生产者直接调用底层数据集的get_item
+        if isinstance(dataset, Subset):
+            self.base = dataset.dataset
+            self.indices = list(dataset.indices)
+        else:
+            self.base = dataset
+            self.indices = list(range(len(dataset)))
+
+        # 用第一个样本确定形状，并根据内存上限计算槽位数
+        sample, _ = self.base.get_item(self.indices[0], 0)
+        sample_bytes = sample.numel() * sample.element_size()
+        self.n_slots = min(int(max_memory_mb * 1024 * 1024 // sample_bytes), 2 * len(self.indices))
+        if self.n_slots < batch_size:
+            raise ValueError(f'max_memory_mb={max_memory_mb} cannot hold one batch of {batch_size} samples '
+                             f'({sample_bytes * batch_size / 2**20:.1f} MB)')
+
+        self.buf = torch.empty((self.n_slots, *sample.shape), dtype=sample.dtype).share_memory_()
+        self.labels = torch.empty(self.n_slots, dtype=torch.int64).share_memory_()
+        self._procs = []
+        self._next_pos = None
+
+    # ----------------------------
+    # Number of batches per epoch
+    # ----------------------------
+    def __len__(self):
+        return math.ceil(len(self.indices) / self.batch_size)
+
+    def set_epoch(self, epoch):
+        """
+        设置下一次迭代的epoch。若与后台正在预取的epoch不连续，则在下一次迭代时重启生产者。
+        """
+        self.epoch = epoch
+
+    def _order(self, epoch):
+        # Sample order for an epoch, reproducible from (seed, epoch)
+        if not self.shuffle:
+            return self.indices
+        g = torch.Generator().manual_seed(self.seed * 1000003 + epoch)
+        return [self.indices[i] for i in torch.randperm(len(self.indices), generator=g).tolist()]
+
+    # ----------------------------
+    # Dispatcher thread: feed tasks, blocking when the ring buffer is full
+    # ----------------------------
+    def _dispatch(self, start_pos):
+        n = len(self.indices)
+        pos = start_pos
+        order = None
+        while not self._stop.is_set():
+            epoch, i = divmod(pos, n)
+            if i == 0 or order is None:
+                order = self._order(epoch)
+            # 背压：最多有n_slots个样本已分派但尚未被训练循环取走
+            while not self._free.acquire(timeout=0.1):
+                if self._stop.is_set():
+                    return
+            self._task_q.put((pos, epoch, order[i], pos % self.n_slots))
+            pos += 1
+
+    def _start(self, epoch):
+        self.close()
+        ctx = mp.get_context()
+        self._task_q = ctx.Queue()
+        self._ready_q = ctx.Queue()
+        self._free = threading.Semaphore(self.n_slots)
+        self._stop = threading.Event()
+        self._ready = set()
+        self._procs = [ctx.Process(target=_producer, daemon=True,
+                                   args=(self.base, self._task_q, self._ready_q, self.buf, self.labels))
+                       for _ in range(self.num_workers)]
+        for p in self._procs:
+            p.start()
+        self._next_pos = epoch * len(self.indices)
+        self._thread = threading.Thread(target=self._dispatch, args=(self._next_pos,), daemon=True)
+        self._thread.start()
+
+    def _wait_ready(self, pos):
+        while pos not in self._ready:
+            try:
+                msg = self._ready_q.get(timeout=1.0)
+            except queue.Empty:
+                if not all(p.is_alive() for p in self._procs):
+                    raise RuntimeError('PrefetchLoader producer process exited unexpectedly')
+                continue
+            if isinstance(msg, tuple):
+                raise RuntimeError(f'PrefetchLoader producer failed:\n{msg[1]}')
+            self._ready.add(msg)
+        self._ready.discard(pos)
+
+    # ----------------------------
+    # Iterate over the batches of the current epoch
+    # ----------------------------
+    def __iter__(self):
+        n = len(self.indices)
+        start = self.epoch * n
+        if self._next_pos != start or not self._procs:
+            self._start(self.epoch)
+
+        for b in range(start, start + n, self.batch_size):
+            positions = range(b, min(b + self.batch_size, start + n))
+            for pos in positions:
+                self._wait_ready(pos)
+            slots = [pos % self.n_slots for pos in positions]
+            # 拷贝出批次后立即释放槽位，让生产者继续填充
+            inputs = self.buf[slots]
+            labels = self.labels[slots]
+            self._next_pos = positions[-1] + 1
+            for _ in positions:
+                self._free.release()
+            yield inputs, labels
+
+    # ----------------------------
+    # Stop the producers
+    # ----------------------------
+    def close(self):
+        if not self._procs:
+            return
+        self._stop.set()
+        self._thread.join()
+        # 丢弃尚未开始的任务，避免退出前把整个缓冲区算完
+        try:
+            while True:
+                self._task_q.get_nowait()
+        except queue.Empty:
+            pass
+        for _ in self._procs:
+            self._task_q.put(None)
+        for p in self._procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self._procs = []
+        self._next_pos = None
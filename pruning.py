@@ -0,0 +1,157 @@
+import argparse
+import copy
+
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader
+from model import AudioClassifier, classifier_from_state, training, evaluate, device
+from variant_benchmark import measure_cost
+
+SPARSITY_LEVELS = [0.25, 0.5, 0.625, 0.75]  # 相对原始模型被剪掉的卷积通道比例
+FINETUNE_EPOCHS = 10  # 每次剪枝后的微调轮数
+MIN_CHANNELS = 2  # 每个卷积块至少保留的通道数
+
+
+def block_channels(model):
+    """
+    返回模型每个卷积块的输出通道数，例如(8, 16, 32, 64)。
+    """
+    channels = []
+    while hasattr(model, f'conv{len(channels) + 1}'):
+        channels.append(getattr(model, f'bn{len(channels) + 1}').num_features)
+    return tuple(channels)
+
+
+# ----------------------------
+# Choose channels by BatchNorm scaling factors
+# ----------------------------
+def select_channels(model, keep_total, min_channels=MIN_CHANNELS):
+    """
+    按BN缩放因子|gamma|在所有卷积块之间统一排序（network slimming），保留最大的keep_total个通道，
+    每个块至少保留min_channels个。
+
+    返回:
+    - list: 每个块保留的通道下标（升序的LongTensor）。
+    """
+    gammas = [getattr(model, f'bn{i}').weight.detach().abs().cpu() for i in range(1, len(block_channels(model)) + 1)]
+    keep = [torch.topk(g, min(min_channels, len(g))).indices for g in gammas]
+    # 在剩余通道中按|gamma|全局选出其余的名额
+    rest = [(float(g[j]), b, j) for b, g in enumerate(gammas) for j in range(len(g)) if j not in set(keep[b].tolist())]
+    rest.sort(reverse=True)
+    extra = max(0, keep_total - sum(len(k) for k in keep))
+    for _, b, j in rest[:extra]:
+        keep[b] = torch.cat([keep[b], torch.tensor([j])])
+    return [k.sort().values for k in keep]
+
+
+# ----------------------------
+# Physically remove channels
+# ----------------------------
+def prune_model(model, keep):
+    """
+    构造一个只包含保留通道的新AudioClassifier并拷贝权重，使稠密模型真正变小、变快。
+    被剪掉的通道经过BN后近似为常数beta，其对下一层的贡献折算进下一层的偏置。
+
+    参数:
+    - model: 待剪枝的AudioClassifier。
+    - keep: select_channels返回的每块保留通道。
+
+    返回:
+    - AudioClassifier: 剪枝后的模型。
+    """
+    separable = hasattr(model, 'dw1')
+    pruned = AudioClassifier(channels=tuple(len(k) for k in keep), separable=separable).to(device)
+    n = len(keep)
+    with torch.no_grad():
+        prev = None  # 上一块保留的通道（即本块保留的输入通道）
+        for i in range(1, n + 1):
+            k = keep[i - 1].to(device)
+            src_conv, dst_conv = getattr(model, f'conv{i}'), getattr(pruned, f'conv{i}')
+            weight = src_conv.weight
+            if separable:
+                src_dw, dst_dw = getattr(model, f'dw{i}'), getattr(pruned, f'dw{i}')
+                dst_dw.weight.copy_(src_dw.weight if prev is None else src_dw.weight[prev])
+            if prev is not None:
+                weight = weight[:, prev]
+            dst_conv.weight.copy_(weight[k])
+            dst_conv.bias.copy_(src_conv.bias[k])
+
+            src_bn, dst_bn = getattr(model, f'bn{i}'), getattr(pruned, f'bn{i}')
+            for name in ('weight', 'bias', 'running_mean', 'running_var'):
+                getattr(dst_bn, name).copy_(getattr(src_bn, name)[k])
+            dst_bn.num_batches_tracked.copy_(src_bn.num_batches_tracked)
+            prev = k
+
+        # 线性层只保留最后一块的通道
+        pruned.lin.weight.copy_(model.lin.weight[:, prev])
+        pruned.lin.bias.copy_(model.lin.bias)
+
+        # 偏置补偿：被剪掉的通道输出约为常数beta
+        for i in range(1, n + 1):
+            src_bn = getattr(model, f'bn{i}')
+            removed = torch.ones(src_bn.num_features, dtype=torch.bool, device=device)
+            removed[keep[i - 1].to(device)] = False
+            if not removed.any():
+                continue
+            beta = src_bn.bias[removed]
+            if i == n:
+                pruned.lin.bias.add_(model.lin.weight[:, removed] @ beta)
+            elif not separable:
+                next_w = getattr(model, f'conv{i + 1}').weight[keep[i].to(device)][:, removed]
+                getattr(pruned, f'conv{i + 1}').bias.add_(next_w.sum(dim=(2, 3)) @ beta)
+            else:
+                # 常数先经过逐通道的depthwise卷积，再经过1x1卷积
+                dw_out = beta * getattr(model, f'dw{i + 1}').weight[removed].sum(dim=(1, 2, 3))
+                next_w = getattr(model, f'conv{i + 1}').weight[keep[i].to(device)][:, removed, 0, 0]
+                getattr(pruned, f'conv{i + 1}').bias.add_(next_w @ dw_out)
+    return pruned
+
+
+def checkpoint(model):
+    """
+    剪枝后的通道数与默认结构不同，保存时一并记录结构信息。
+    """
+    return {'channels': block_channels(model), 'separable': hasattr(model, 'dw1'), 'state_dict': model.state_dict()}
+
+
+def load_checkpoint(path):
+    return classifier_from_state(torch.load(path, map_location=device)).to(device)
+
+
+if __name__ == "__main__":
+    from dataset_us8k import train_ds, val_ds, FEATURE_CACHE_DIR, SEED
+    from feature_cache import CachedSoundDS, load_or_build_feature_cache
+
+    parser = argparse.ArgumentParser(description='Iterative BN-guided channel pruning of AudioClassifier')
+    parser.add_argument('--checkpoint', default='best_model.pt', help='trained AudioClassifier weights')
+    parser.add_argument('--levels', type=float, nargs='+', default=SPARSITY_LEVELS)
+    parser.add_argument('--finetune-epochs', type=int, default=FINETUNE_EPOCHS)
+    parser.add_argument('--max-lr', type=float, default=0.0005)
+    parser.add_argument('--output', default='pruning_results.csv')
+    args = parser.parse_args()
+
+    train_cache = load_or_build_feature_cache(train_ds, FEATURE_CACHE_DIR/'train')
+    val_cache = load_or_build_feature_cache(val_ds, FEATURE_CACHE_DIR/'val')
+    train_dl = DataLoader(CachedSoundDS(train_cache, augment=True, seed=SEED), batch_size=16, shuffle=True)
+    val_dl = DataLoader(CachedSoundDS(val_cache), batch_size=64, shuffle=False)
+
+    model = load_checkpoint(args.checkpoint)
+    original_total = sum(block_channels(model))
+
+    rows = [{'sparsity': 0.0, 'channels': block_channels(model), 'val_acc': evaluate(model, val_dl)[1],
+             **measure_cost(copy.deepcopy(model).cpu())}]
+    print(rows[-1])
+    for level in sorted(args.levels):
+        keep_total = round(original_total * (1 - level))
+        model = prune_model(model, select_channels(model, keep_total))
+        acc_before = evaluate(model, val_dl)[1]
+        # 微调恢复准确率（training结束时恢复验证集上最好的权重）
+        training(model, train_dl, args.finetune_epochs, val_dl=val_dl, max_lr=args.max_lr)
+        torch.save(checkpoint(model), f'pruned_{int(level * 100)}.pt')
+        rows.append({'sparsity': level, 'channels': block_channels(model), 'val_acc_before_finetune': acc_before,
+                     'val_acc': evaluate(model, val_dl)[1], **measure_cost(copy.deepcopy(model).cpu())})
+        print(rows[-1])
+
+    table = pd.DataFrame(rows)
+    table.to_csv(args.output, index=False)
+    print(table.to_string(index=False))
@@ -0,0 +1,131 @@
+import math
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler, Subset
+
+
+# ----------------------------
+# Labels of a dataset or random_split Subset
+# ----------------------------
+def dataset_labels(ds):
+    """
+    返回数据集中每个样本的类别ID（按数据集内的位置排列），可穿过random_split产生的Subset。
+
+    参数:
+    - ds: SoundDS或其Subset。
+
+    返回:
+    - numpy.ndarray: 类别ID数组。
+    """
+    if isinstance(ds, Subset):
+        return dataset_labels(ds.dataset)[np.asarray(ds.indices)]
+    return ds.df['classID'].to_numpy()
+
+
+def class_balanced_weights(labels):
+    """
+    计算类别均衡的样本权重：每个样本的权重与其类别的样本数成反比，使每个类别被抽到的概率相同。
+
+    参数:
+    - labels: 类别ID数组。
+
+    返回:
+    - numpy.ndarray: 与labels等长的float64权重。
+    """
+    labels = np.asarray(labels)
+    counts = np.bincount(labels)
+    return 1.0 / counts[labels]
+
+
+# ----------------------------
+# Class-balanced sampler
+# ----------------------------
+class ClassBalancedSampler(Sampler):
+    """
+    ClassBalancedSampler按类别均衡的概率有放回地抽样，让gun_shot、car_horn等稀有类别在每个epoch中
+    出现的次数与常见类别相同。
+
+    参数:
+    - labels: 每个样本的类别ID（位置与数据集一致），可用dataset_labels获得。
+    - num_samples: 每个epoch抽取的样本数，默认为数据集大小（保持len(train_dl)不变）。
+    - seed: 随机种子，每个epoch的抽样由(seed, epoch)确定。
+    """
+    def __init__(self, labels, num_samples=None, seed=0):
+        self.weights = torch.as_tensor(class_balanced_weights(labels), dtype=torch.float64)
+        self.num_samples = len(self.weights) if num_samples is None else num_samples
+        self.seed = seed
+        self.epoch = 0
+        self.order = np.empty(0, dtype=np.int64)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _generator(self):
+        return torch.Generator().manual_seed(self.seed * 1000003 + self.epoch)
+
+    def __iter__(self):
+        order = torch.multinomial(self.weights, self.num_samples, replacement=True, generator=self._generator())
+        # 记录本epoch的抽样顺序，训练循环可据此找到每个批次对应的样本
+        self.order = order.numpy()
+        return iter(self.order.tolist())
+
+    def __len__(self):
+        return self.num_samples
+
+    def batch_indices(self, i, batch_size):
+        """
+        返回第i个批次中样本在数据集内的位置（DataLoader按顺序组批时成立）。
+        """
+        return self.order[i * batch_size:(i + 1) * batch_size]
+
+
+# ----------------------------
+# Loss-based hard-example sampler
+# ----------------------------
+class HardExampleSampler(ClassBalancedSampler):
+    """
+    HardExampleSampler根据model.training记录的每个样本的损失（指数滑动平均，存放在紧凑的float32数组中）
+    调整抽样概率：损失越大的样本越容易被抽到。为避免遗忘已学会的样本，概率中混入一部分均匀分布。
+
+    参数:
+    - num_items: 数据集大小。
+    - labels: 可选，给定时再乘以类别均衡权重。
+    - num_samples: 每个epoch抽取的样本数，默认为数据集大小。
+    - alpha: 损失的指数，越大越偏向困难样本。
+    - uniform_mix: 均匀分布所占的比例。
+    - momentum: 损失滑动平均的动量。
+    - init_loss: 尚未见过的样本的初始损失（默认为10类交叉熵的随机猜测水平）。
+    - seed: 随机种子。
+    """
+    def __init__(self, num_items, labels=None, num_samples=None, alpha=1.0, uniform_mix=0.2,
+                 momentum=0.9, init_loss=math.log(10), seed=0):
+        self.base_weights = np.ones(num_items) if labels is None else class_balanced_weights(labels)
+        self.losses = np.full(num_items, init_loss, dtype=np.float32)
+        self.num_samples = num_items if num_samples is None else num_samples
+        self.alpha = alpha
+        self.uniform_mix = uniform_mix
+        self.momentum = momentum
+        self.seed = seed
+        self.epoch = 0
+        self.order = np.empty(0, dtype=np.int64)
+
+    @property
+    def weights(self):
+        w = self.base_weights * np.power(self.losses.astype(np.float64) + 1e-6, self.alpha)
+        w = w / w.sum()
+        base = self.base_weights / self.base_weights.sum()
+        return torch.as_tensor((1 - self.uniform_mix) * w + self.uniform_mix * base)
+
+    def update(self, indices, losses):
+        """
+        用一个批次的逐样本损失更新滑动平均。
+
+        参数:
+        - indices: 样本在数据集内的位置，见batch_indices。
+        - losses: 与indices等长的逐样本损失（Tensor或数组）。
+        """
+        if torch.is_tensor(losses):
+            losses = losses.detach().cpu().numpy()
+        m = self.momentum
+        self.losses[indices] = m * self.losses[indices] + (1 - m) * losses
@@ -0,0 +1,191 @@
+import argparse
+import copy
+import math
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, Subset
+from dataset_us8k import myds, train_ds, val_ds, FEATURE_CACHE_DIR, SEED
+from feature_cache import CachedSoundDS, load_or_build_feature_cache
+from model import AudioClassifier, training, device
+
+# ----------------------------
+# Search space and sweep settings
+# ----------------------------
+SEARCH_SPACE = {
+    'max_lr': [3e-4, 1e-3, 3e-3, 1e-2],
+    'batch_size': [16, 32, 64],
+    'n_mels': [32, 64, 128],
+    'max_mask_pct': [0.0, 0.05, 0.1, 0.2],
+    'channels': [(8, 16, 32, 64), (16, 32, 64, 128), (32, 64, 128, 256)],
+}
+NUM_TRIALS = 24  # 采样的超参数组合数量
+NUM_WORKERS = 4  # 同时运行的试验数量
+MIN_EPOCHS = 5  # 最低一档（rung）的训练轮数
+MAX_EPOCHS = 45  # 单个试验的最大训练轮数（也是OneCycleLR的总轮数）
+REDUCTION = 3  # ASHA的淘汰比例：每档只有前1/REDUCTION的试验晋级
+SWEEP_DIR = Path.cwd()/'sweep_runs'
+
+
+def sample_configs(num_trials, seed=SEED):
+    """
+    从SEARCH_SPACE中随机采样num_trials个超参数组合（由seed确定）。
+    """
+    rng = random.Random(seed)
+    return [{k: rng.choice(v) for k, v in SEARCH_SPACE.items()} for _ in range(num_trials)]
+
+
+def rung_epochs(min_epochs=MIN_EPOCHS, max_epochs=MAX_EPOCHS, reduction=REDUCTION):
+    """
+    各档的累计训练轮数，例如5、15、45。
+    """
+    rungs = [min_epochs]
+    while rungs[-1] * reduction < max_epochs:
+        rungs.append(rungs[-1] * reduction)
+    if rungs[-1] < max_epochs:
+        rungs.append(max_epochs)
+    return rungs
+
+
+# ----------------------------
+# Shared feature caches (one per n_mels)
+# ----------------------------
+def build_caches(n_mels_values, num_workers=0):
+    """
+    为每个n_mels取值构建一次训练集和验证集的特征缓存，所有试验共享读取。
+
+    返回:
+    - dict: n_mels -> {'train': 缓存目录, 'val': 缓存目录}。
+    """
+    caches = {}
+    for n_mels in sorted(set(n_mels_values)):
+        base = copy.copy(myds)
+        base.n_mels = n_mels
+        caches[n_mels] = {
+            split: load_or_build_feature_cache(Subset(base, ds.indices), FEATURE_CACHE_DIR/f'{split}_mels{n_mels}',
+                                               num_workers=num_workers)
+            for split, ds in (('train', train_ds), ('val', val_ds))
+        }
+    return caches
+
+
+# ----------------------------
+# Run one trial up to the next rung
+# ----------------------------
+def run_trial(trial_id, config, start_epoch, end_epoch, max_epochs, caches, threads):
+    """
+    在子进程中把一个试验从start_epoch训练到end_epoch，状态保存在SWEEP_DIR/trial_<id>.pt，
+    晋级到下一档时从该状态继续训练。学习率调度按max_epochs设置，各档之间连续。
+
+    返回:
+    - tuple: (trial_id, end_epoch, 验证集准确率, 验证集损失, 本段耗时秒数)。
+    """
+    torch.set_num_threads(threads)
+    start = time.monotonic()
+    torch.manual_seed(SEED + trial_id)
+
+    cache = caches[config['n_mels']]
+    train_cached = CachedSoundDS(cache['train'], augment=True, max_mask_pct=config['max_mask_pct'], seed=SEED)
+    train_dl = DataLoader(train_cached, batch_size=config['batch_size'], shuffle=True,
+                          generator=torch.Generator().manual_seed(SEED + trial_id))
+    val_dl = DataLoader(CachedSoundDS(cache['val']), batch_size=64, shuffle=False)
+
+    model = AudioClassifier(channels=config['channels']).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=config['max_lr'])
+    scheduler = torch.optim.lr_scheduler.OneCycleLR(optimizer, max_lr=config['max_lr'],
+                                                    steps_per_epoch=len(train_dl), epochs=max_epochs,
+                                                    anneal_strategy='linear')
+    state_path = SWEEP_DIR/f'trial_{trial_id}.pt'
+    if start_epoch > 0:
+        state = torch.load(state_path, map_location=device)
+        model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        scheduler.load_state_dict(state['scheduler'])
+
+    history = training(model, train_dl, end_epoch, val_dl=val_dl, val_every=max_epochs, start_epoch=start_epoch,
+                       optimizer=optimizer, scheduler=scheduler)
+    torch.save({'model': model.state_dict(), 'optimizer': optimizer.state_dict(),
+                'scheduler': scheduler.state_dict()}, state_path)
+    return trial_id, end_epoch, history[-1]['val_acc'], history[-1]['val_loss'], time.monotonic() - start
+
+
+# ----------------------------
+# Asynchronous successive halving (ASHA)
+# ----------------------------
+def run_sweep(configs, rungs, num_workers=NUM_WORKERS, reduction=REDUCTION):
+    """
+    用进程池并行运行试验，并按ASHA提前终止表现差的试验：某一档完成的试验中，排名进入前1/reduction的
+    立即晋级到下一档继续训练；有空闲进程且没有可晋级的试验时启动新的试验。
+
+    返回:
+    - pandas.DataFrame: 每个试验的超参数、到达的档位、训练轮数和最终验证集指标，按档位和准确率降序排列。
+    """
+    SWEEP_DIR.mkdir(parents=True, exist_ok=True)
+    caches = build_caches([c['n_mels'] for c in configs], num_workers=num_workers)
+    threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    results = [[] for _ in rungs]  # 每档已完成的 (val_acc, trial_id)
+    promoted = [set() for _ in rungs]
+    rows = {i: {'trial': i, **c, 'rung': -1, 'epochs': 0, 'val_acc': math.nan, 'val_loss': math.nan, 'seconds': 0.0}
+            for i, c in enumerate(configs)}
+    next_trial = 0
+
+    def next_job():
+        nonlocal next_trial
+        # 优先晋级：从高档往低档找排名靠前且尚未晋级的试验
+        for k in reversed(range(len(rungs) - 1)):
+            top = sorted(results[k], reverse=True)[:len(results[k]) // reduction]
+            for _, trial_id in top:
+                if trial_id not in promoted[k]:
+                    promoted[k].add(trial_id)
+                    return trial_id, rungs[k], rungs[k + 1]
+        if next_trial < len(configs):
+            next_trial += 1
+            return next_trial - 1, 0, rungs[0]
+        return None
+
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        running = set()
+        while True:
+            while len(running) < num_workers:
+                job = next_job()
+                if job is None:
+                    break
+                trial_id, start_epoch, end_epoch = job
+                running.add(pool.submit(run_trial, trial_id, configs[trial_id], start_epoch, end_epoch,
+                                        rungs[-1], caches, threads))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                trial_id, end_epoch, val_acc, val_loss, seconds = fut.result()
+                k = rungs.index(end_epoch)
+                results[k].append((val_acc, trial_id))
+                rows[trial_id].update(rung=k, epochs=end_epoch, val_acc=val_acc, val_loss=val_loss,
+                                      seconds=rows[trial_id]['seconds'] + seconds)
+                print(f'Trial {trial_id} rung {k} ({end_epoch} epochs): Val Accuracy: {val_acc:.3f}')
+
+    return pd.DataFrame(rows.values()).sort_values(['rung', 'val_acc'], ascending=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep for AudioClassifier with ASHA early termination')
+    parser.add_argument('--trials', type=int, default=NUM_TRIALS)
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS)
+    parser.add_argument('--min-epochs', type=int, default=MIN_EPOCHS)
+    parser.add_argument('--max-epochs', type=int, default=MAX_EPOCHS)
+    parser.add_argument('--reduction', type=int, default=REDUCTION)
+    parser.add_argument('--output', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    table = run_sweep(sample_configs(args.trials), rung_epochs(args.min_epochs, args.max_epochs, args.reduction),
+                      num_workers=args.workers, reduction=args.reduction)
+    table.to_csv(args.output, index=False)
+    print(table.to_string(index=False))
+    print(f'Sweep finished in {(time.monotonic() - start) / 60:.1f} minutes, results saved to {args.output}')
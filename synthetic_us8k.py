@@ -0,0 +1,151 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+import torchaudio
+
+# ----------------------------
+# Distribution of the real UrbanSound8K dataset (8732 clips)
+# ----------------------------
+CLASS_COUNTS = {
+    'air_conditioner': 1000, 'car_horn': 429, 'children_playing': 1000, 'dog_bark': 1000, 'drilling': 1000,
+    'engine_idling': 1000, 'gun_shot': 374, 'jackhammer': 1000, 'siren': 929, 'street_music': 1000,
+}
+FOLD_COUNTS = [873, 888, 925, 990, 936, 823, 838, 806, 816, 837]
+SAMPLE_RATE_COUNTS = {
+    44100: 5370, 48000: 2502, 96000: 610, 24000: 82, 16000: 45, 22050: 44, 11025: 39, 192000: 17, 8000: 12,
+    11024: 7, 32000: 4,
+}
+CHANNEL_COUNTS = {2: 7993, 1: 739}
+FULL_LENGTH_FRACTION = 0.84  # 约84%的片段为完整的4秒，其余时长在MIN_DURATION到4秒之间
+MAX_DURATION = 4.0
+MIN_DURATION = 0.05
+SALIENCE_1_FRACTION = 0.65  # salience=1（前景）所占的比例
+
+OUTPUT_DIR = Path.cwd()/'synthetic'  # 生成的数据集位于OUTPUT_DIR/UrbanSound8K/UrbanSound8K
+
+
+def _choice(rng, counts, size):
+    keys = list(counts)
+    p = np.array([counts[k] for k in keys], dtype=np.float64)
+    return np.array(keys)[rng.choice(len(keys), size=size, p=p / p.sum())]
+
+
+# ----------------------------
+# Metadata
+# ----------------------------
+def make_metadata(scale=1.0, seed=0):
+    """
+    生成与真实UrbanSound8K分布一致的元数据：每个类别的数量为真实数量乘以scale，
+    fold、采样率、声道数、时长和salience按真实数据集的比例随机抽取。
+
+    参数:
+    - scale: 相对真实数据集的规模，例如10表示约87320个片段。
+    - seed: 随机种子。
+
+    返回:
+    - pandas.DataFrame: 与UrbanSound8K.csv列相同，并附加sr和channels两列（写入音频时使用）。
+    """
+    rng = np.random.default_rng(seed)
+    class_names = list(CLASS_COUNTS)
+    class_ids = np.concatenate([np.full(int(round(n * scale)), i) for i, n in enumerate(CLASS_COUNTS.values())])
+    n = len(class_ids)
+
+    folds = _choice(rng, dict(enumerate(FOLD_COUNTS, 1)), n)
+    srs = _choice(rng, SAMPLE_RATE_COUNTS, n)
+    channels = _choice(rng, CHANNEL_COUNTS, n)
+    durations = np.where(rng.random(n) < FULL_LENGTH_FRACTION, MAX_DURATION,
+                         rng.uniform(MIN_DURATION, MAX_DURATION, n)).round(6)
+    starts = rng.uniform(0, 60, n).round(6)
+    fs_ids = rng.integers(1000, 200000, n)
+
+    df = pd.DataFrame({
+        'slice_file_name': [f'{fs}-{c}-0-{i}.wav' for i, (fs, c) in enumerate(zip(fs_ids, class_ids))],
+        'fsID': fs_ids,
+        'start': starts,
+        'end': starts + durations,
+        'salience': np.where(rng.random(n) < SALIENCE_1_FRACTION, 1, 2),
+        'fold': folds,
+        'classID': class_ids,
+        'class': [class_names[c] for c in class_ids],
+        'sr': srs,
+        'channels': channels,
+    })
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+# ----------------------------
+# Audio
+# ----------------------------
+def synth_clip(class_id, sr, channels, duration, seed):
+    """
+    合成一个片段：与类别相关的谐波音加上噪声和随机包络，使模型能学到类别差异，频谱计算量与真实音频相同。
+    """
+    g = torch.Generator().manual_seed(int(seed))
+    num_samples = max(1, int(sr * duration))
+    t = torch.arange(num_samples) / sr
+    f0 = 110.0 * (1.25 ** class_id)
+    tone = sum(torch.sin(2 * torch.pi * f0 * k * t) / k for k in (1, 2, 3))
+    envelope = 0.5 + 0.5 * torch.sin(2 * torch.pi * (0.5 + float(torch.rand(1, generator=g)) * 4) * t)
+    sig = 0.3 * tone * envelope + 0.05 * torch.randn((channels, num_samples), generator=g)
+    return sig.clamp(-1, 1)
+
+
+def _write_rows(args):
+    root, rows, seed = args
+    nbytes = 0
+    for i, row in rows:
+        sig = synth_clip(row['classID'], row['sr'], row['channels'], row['end'] - row['start'], seed + i)
+        path = root/f'fold{row["fold"]}'/row['slice_file_name']
+        torchaudio.save(str(path), sig, int(row['sr']), encoding='PCM_S', bits_per_sample=16)
+        nbytes += os.path.getsize(path)
+    return len(rows), nbytes
+
+
+def generate(output_dir=OUTPUT_DIR, scale=1.0, seed=0, num_workers=None, chunk_size=256):
+    """
+    在output_dir/UrbanSound8K/UrbanSound8K下生成元数据CSV和WAV文件，用进程池并行写入。
+    生成后设置US8K_PATH=<数据集根目录>（或在output_dir下运行）即可让Classification.py读取它。
+
+    返回:
+    - Path: 数据集根目录。
+    """
+    root = Path(output_dir)/'UrbanSound8K'/'UrbanSound8K'
+    (root/'metadata').mkdir(parents=True, exist_ok=True)
+    for fold in range(1, 11):
+        (root/f'fold{fold}').mkdir(exist_ok=True)
+
+    df = make_metadata(scale, seed)
+    rows = list(enumerate(df.to_dict('records')))
+    chunks = [(root, rows[i:i + chunk_size], seed) for i in range(0, len(rows), chunk_size)]
+
+    start = time.monotonic()
+    written, nbytes = 0, 0
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        for n, b in pool.map(_write_rows, chunks):
+            written += n
+            nbytes += b
+            print(f'\r已写入 {written}/{len(rows)} 个文件', end='', flush=True)
+    elapsed = time.monotonic() - start
+
+    df.drop(columns=['sr', 'channels']).to_csv(root/'metadata'/'UrbanSound8K.csv', index=False)
+    print(f'\n生成 {written} 个文件，共 {nbytes / 2**30:.2f} GB，用时 {elapsed:.1f} 秒 '
+          f'({written / elapsed:.0f} 文件/秒)')
+    return root
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic dataset shaped like UrbanSound8K')
+    parser.add_argument('--output', default=str(OUTPUT_DIR))
+    parser.add_argument('--scale', type=float, default=1.0, help='size relative to the real dataset, e.g. 10 or 100')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    root = generate(args.output, args.scale, args.seed, args.workers)
+    print(f'US8K_PATH={root}')
@@ -0,0 +1,112 @@
+import argparse
+import time
+
+import pandas as pd
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from benchmark import _time
+from model import MODEL_VARIANTS, build_model, training, evaluate, device
+
+INPUT_SHAPE = (2, 64, 344)  # SoundDS输出的声谱图形状
+LATENCY_BATCHES = [1, 64]
+EPOCHS = 20  # 测量准确率时每个变体的训练轮数
+
+
+# ----------------------------
+# Parameters and FLOPs
+# ----------------------------
+def count_flops(model, input_shape=INPUT_SHAPE):
+    """
+    用前向钩子统计单个样本的浮点运算量（卷积层和线性层，乘加计为2次运算）。
+
+    返回:
+    - float: MFLOPs。
+    """
+    flops = 0
+
+    def conv_hook(module, inputs, output):
+        nonlocal flops
+        kh, kw = module.kernel_size
+        flops += 2 * output.numel() * (module.in_channels // module.groups) * kh * kw
+
+    def linear_hook(module, inputs, output):
+        nonlocal flops
+        flops += 2 * output.numel() * module.in_features
+
+    hooks = []
+    for m in model.modules():
+        if isinstance(m, nn.Conv2d):
+            hooks.append(m.register_forward_hook(conv_hook))
+        elif isinstance(m, nn.Linear):
+            hooks.append(m.register_forward_hook(linear_hook))
+    model.eval()
+    with torch.no_grad():
+        model(torch.zeros(1, *input_shape))
+    for h in hooks:
+        h.remove()
+    return flops / 1e6
+
+
+def measure_cost(model, batch_sizes=LATENCY_BATCHES, repeat=20):
+    """
+    返回参数量、MFLOPs以及各批大小下的CPU推理延迟（毫秒，中位数）。
+    """
+    row = {'params': sum(p.numel() for p in model.parameters()), 'mflops': count_flops(model)}
+    model.eval()
+    for bs in batch_sizes:
+        inputs = torch.randn(bs, *INPUT_SHAPE)
+        with torch.no_grad():
+            row[f'latency_b{bs}_ms'] = _time(lambda: model(inputs), repeat)['median_ms']
+    return row
+
+
+# ----------------------------
+# Accuracy on the cached features
+# ----------------------------
+def measure_accuracy(model, train_cache, val_cache, epochs=EPOCHS, batch_size=16, seed=42):
+    """
+    在特征缓存上训练epochs轮，返回验证集上的最佳准确率和训练耗时。
+    """
+    from feature_cache import CachedSoundDS
+
+    torch.manual_seed(seed)
+    train_dl = DataLoader(CachedSoundDS(train_cache, augment=True, seed=seed), batch_size=batch_size, shuffle=True,
+                          generator=torch.Generator().manual_seed(seed))
+    val_dl = DataLoader(CachedSoundDS(val_cache), batch_size=64, shuffle=False)
+    start = time.monotonic()
+    training(model.to(device), train_dl, epochs, val_dl=val_dl, val_every=1)
+    _, acc = evaluate(model, val_dl)
+    return {'val_acc': acc, 'train_minutes': (time.monotonic() - start) / 60}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare AudioClassifier size/latency variants')
+    parser.add_argument('--variants', nargs='+', default=list(MODEL_VARIANTS), choices=list(MODEL_VARIANTS))
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--skip-accuracy', action='store_true', help='only report params, MFLOPs and latency')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads for latency')
+    parser.add_argument('--output', default='variant_results.csv')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    if not args.skip_accuracy:
+        from dataset_us8k import train_ds, val_ds, FEATURE_CACHE_DIR
+        from feature_cache import load_or_build_feature_cache
+        train_cache = load_or_build_feature_cache(train_ds, FEATURE_CACHE_DIR/'train')
+        val_cache = load_or_build_feature_cache(val_ds, FEATURE_CACHE_DIR/'val')
+
+    rows = []
+    for name in args.variants:
+        model = build_model(name)
+        row = {'variant': name, 'separable': False, **MODEL_VARIANTS[name], **measure_cost(model)}
+        if not args.skip_accuracy:
+            row.update(measure_accuracy(model, train_cache, val_cache, args.epochs))
+        rows.append(row)
+        print(row)
+
+    table = pd.DataFrame(rows)
+    table.to_csv(args.output, index=False)
+    print(table.to_string(index=False))
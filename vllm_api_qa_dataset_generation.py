@@ -1,18 +1,32 @@
 import os
 import json
-import requests
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+import aiohttp
 from tqdm import tqdm
+from chunk_store import chunk_hash, iter_chunks
+from llm_cache import LLMCache, cache_key
 
 # Configuration
 API_URL = "http://localhost:8000/v1/chat/completions"
-SPLIT_FILES_DIR = "split_markdown_docs"
+CHUNK_STORE_PATH = os.path.join("split_markdown_docs", "chunks_dedup.jsonl")  # Chunk store deduplicated by chunk_dedup.py
 OUTPUT_DIR = "qa_dataset"
 MODEL_NAME = "Qwen/QwQ-32B-AWQ"
 ALL_QA_OUTPUT_FILE = "all_qa_pairs.json"
+JOURNAL_FILE = "progress_journal.jsonl"  # Append-only per-chunk progress in OUTPUT_DIR; re-runs skip completed chunks
+MAX_IN_FLIGHT = 32  # Concurrent requests (and pooled connections); about the server's batch capacity, e.g. vLLM --max-num-seqs
+REQUEST_TIMEOUT = 120  # Seconds per attempt; a saturated server queues requests instead of failing them
+MAX_RETRIES = 5  # Retries on 429/5xx, timeouts and connection errors
+BACKOFF_BASE = 1.0  # Seconds before the first retry, doubled for every further retry
+BACKOFF_MAX = 30.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
-def generate_qa_pairs(text, num_pairs=10):
+def build_payload(text, num_pairs=10):
     """
-    Generate QA pairs via API call with strict JSON output validation
+    Chat completion request asking for exactly num_pairs QA pairs as strict JSON
     """
     structured_prompt = f"""Generate exactly {num_pairs} high-quality question-answer pairs from the following text.
     
@@ -45,63 +59,120 @@ Output MUST be ONLY valid JSON:"""
         "temperature": 0.3,  # Slightly relaxed for better quality
         "response_format": {"type": "json_object"}  # Enforce JSON mode
     }
+    return payload
+
+def parse_qa_pairs(raw_content):
+    """
+    Validate the model output and extract the QA pairs, with recovery for common formatting issues
+    """
+    # JSON Sanitization Pipeline
+    sanitized = raw_content.strip()
+    if not sanitized:
+        return []
+    
+    # Attempt to fix common formatting issues
+    for fix in ['```json', '```']:
+        if sanitized.startswith(fix):
+            sanitized = sanitized[len(fix):].strip()
     
     try:
-        response = requests.post(API_URL, json=payload, timeout=30)
-        response.raise_for_status()
-        result = response.json()
-        raw_content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+        # Primary JSON parsing
+        parsed = json.loads(sanitized)
+        if not isinstance(parsed, dict):
+            raise ValueError("Top-level structure must be a dictionary")
         
-        # JSON Sanitization Pipeline
-        sanitized = raw_content.strip()
-        if not sanitized:
-            return []
+        qa_list = parsed.get("qa_pairs", [])
+        if not isinstance(qa_list, list):
+            raise ValueError("qa_pairs must be an array")
         
-        # Attempt to fix common formatting issues
-        for fix in ['```json', '```']:
-            if sanitized.startswith(fix):
-                sanitized = sanitized[len(fix):].strip()
+        # Validate each pair
+        valid_pairs = []
+        for pair in qa_list:
+            if isinstance(pair, dict) and "question" in pair and "answer" in pair:
+                valid_pairs.append({
+                    "question": str(pair["question"]).strip(),
+                    "answer": str(pair["answer"]).strip()
+                })
+        return valid_pairs
         
+    except (json.JSONDecodeError, ValueError) as e:
+        # Fallback JSON extraction
+        print(f"JSON Error: {str(e)} | Attempting recovery...")
+        start = sanitized.find('{')
+        end = sanitized.rfind('}') + 1
+        if start != -1 and end != -1:
+            try:
+                recovered = json.loads(sanitized[start:end])
+                return recovered.get("qa_pairs", [])
+            except:
+                pass
+        return []
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with jitter, never shorter than the server's Retry-After"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+    try:
+        return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        return delay
+
+async def post_with_retry(session, payload):
+    """POST the request, retrying on 429/5xx, timeouts and connection errors"""
+    for attempt in range(MAX_RETRIES + 1):
         try:
-            # Primary JSON parsing
-            parsed = json.loads(sanitized)
-            if not isinstance(parsed, dict):
-                raise ValueError("Top-level structure must be a dictionary")
-            
-            qa_list = parsed.get("qa_pairs", [])
-            if not isinstance(qa_list, list):
-                raise ValueError("qa_pairs must be an array")
-            
-            # Validate each pair
-            valid_pairs = []
-            for pair in qa_list:
-                if isinstance(pair, dict) and "question" in pair and "answer" in pair:
-                    valid_pairs.append({
-                        "question": str(pair["question"]).strip(),
-                        "answer": str(pair["answer"]).strip()
-                    })
-            return valid_pairs
-            
-        except (json.JSONDecodeError, ValueError) as e:
-            # Fallback JSON extraction
-            print(f"JSON Error: {str(e)} | Attempting recovery...")
-            start = sanitized.find('{')
-            end = sanitized.rfind('}') + 1
-            if start != -1 and end != -1:
-                try:
-                    recovered = json.loads(sanitized[start:end])
-                    return recovered.get("qa_pairs", [])
-                except:
-                    pass
-            return []
-            
-    except requests.RequestException as e:
-        print(f"API Error: {str(e)}")
+            async with session.post(API_URL, json=payload) as response:
+                if response.status not in RETRY_STATUS or attempt == MAX_RETRIES:
+                    response.raise_for_status()
+                    return await response.json()
+                delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+            if attempt == MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+        await asyncio.sleep(delay)
+
+def payload_cache_key(payload):
+    """Cache key of a request: model, prompt (messages and response format) and sampling parameters"""
+    prompt = {"messages": payload["messages"], "response_format": payload.get("response_format")}
+    return cache_key(payload["model"], prompt, payload.get("temperature"), payload.get("top_p"),
+                     payload.get("max_tokens"), payload.get("seed"))
+
+async def generate_qa_pairs_async(session, semaphore, text, num_pairs=10, cache=None):
+    """
+    Generate QA pairs via API call with strict JSON output validation; the semaphore bounds requests in flight.
+    Raw completions are looked up in / stored to the shared prompt cache, so only cache misses reach the server.
+    Only completions that yield QA pairs are cached, so --retry-failed always asks the model again.
+    SQLite calls run in worker threads to keep the event loop free while the database is busy
+    """
+    try:
+        payload = build_payload(text, num_pairs)
+        key = payload_cache_key(payload)
+        raw_content = await asyncio.to_thread(cache.get, key) if cache else None
+        qa_pairs = parse_qa_pairs(raw_content) if raw_content is not None else []
+        if not qa_pairs:
+            async with semaphore:
+                result = await post_with_retry(session, payload)
+            raw_content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+            qa_pairs = parse_qa_pairs(raw_content)
+            if cache and qa_pairs:
+                await asyncio.to_thread(cache.put, key, raw_content, MODEL_NAME)
+        return qa_pairs
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"API Error: {str(e) or type(e).__name__}")
         return []
     except Exception as e:
         print(f"Unexpected Error: {str(e)}")
         return []
 
+def generate_qa_pairs(text, num_pairs=10):
+    """
+    Generate QA pairs for a single text (synchronous wrapper)
+    """
+    async def run():
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as session:
+            return await generate_qa_pairs_async(session, asyncio.Semaphore(1), text, num_pairs)
+    return asyncio.run(run())
+
 def save_to_file(data, file_path):
     """Atomic write with backup preservation"""
     try:
@@ -110,47 +181,164 @@ def save_to_file(data, file_path):
             json.dump(data, f, ensure_ascii=False, indent=2)
         os.replace(temp_path, file_path)
         print(f"Saved {len(data)} items to {file_path}")
+        return True
     except Exception as e:
         print(f"Save Error: {str(e)}")
+        return False
+
+def read_journal(journal_path):
+    """Latest journal entry per chunk hash (later lines override earlier ones)"""
+    entries = {}
+    if os.path.exists(journal_path):
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Line cut short by a crash
+                entries[entry["chunk_hash"]] = entry
+    return entries
+
+def open_journal(journal_path):
+    """Open the journal for appending, first dropping a partial last line left by a crash"""
+    if os.path.exists(journal_path):
+        with open(journal_path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+    return open(journal_path, 'a', encoding='utf-8')
+
+def chunk_state(entry):
+    """'done' if the chunk's QA file exists, 'failed' if the last attempt failed, otherwise 'new'"""
+    if entry is None:
+        return "new"
+    if entry["status"] == "done":
+        return "done" if os.path.exists(os.path.join(OUTPUT_DIR, entry["output"])) else "new"
+    return entry["status"]
+
+def collect_result(filename, digest, qa_data, journal_file):
+    """Save the chunk's QA pairs and append the outcome to the journal; returns the status"""
+    output = f"{os.path.splitext(filename)[0]}_qa.json"
+    status = "failed"
+    try:
+        if not qa_data:
+            print(f"No valid QA pairs in {filename}")
+        else:
+            # Save individual file QA
+            output_file = os.path.join(OUTPUT_DIR, output)
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            if save_to_file({"source": filename, "qa_pairs": qa_data}, output_file):
+                status = "done"
+            
+    except Exception as e:
+        print(f"Processing Error [{filename}]: {str(e)}")
+    # The journal line is written after the QA file, so a "done" entry always has its output
+    journal_file.write(json.dumps({"chunk_hash": digest, "file": filename, "status": status,
+                                   "output": output if status == "done" else None,
+                                   "pairs": len(qa_data) if status == "done" else 0}, ensure_ascii=False) + "\n")
+    journal_file.flush()
+    return status
 
-def process_files():
+def build_master_dataset(journal_path, output_path):
+    """
+    Stream the QA pairs of every completed chunk, in chunk store order, into the consolidated file
+    without holding the dataset in memory; same layout as json.dump(..., indent=2)
+    """
+    journal = read_journal(journal_path)
+    seen = set()
+    count = 0
+    with open(f"{output_path}.tmp", 'w', encoding='utf-8') as out:
+        out.write("[")
+        for chunk in iter_chunks(CHUNK_STORE_PATH):
+            digest = chunk.get("chunk_hash") or chunk_hash(chunk["text"])
+            if digest in seen or chunk_state(journal.get(digest)) != "done":
+                continue
+            seen.add(digest)
+            with open(os.path.join(OUTPUT_DIR, journal[digest]["output"]), 'r', encoding='utf-8') as f:
+                qa_pairs = json.load(f)["qa_pairs"]
+            for pair in qa_pairs:
+                item = json.dumps(pair, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                out.write(("," if count else "") + "\n  " + item)
+                count += 1
+        out.write("\n]" if count else "]")
+    os.replace(f"{output_path}.tmp", output_path)
+    return count
+
+async def process_files_async(retry_failed=False, refresh_cache=False):
+    """
+    Generate QA pairs for new chunks (or, with retry_failed, only for chunks whose last attempt failed),
+    recording every outcome in the journal, then rebuild the consolidated dataset
+    """
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    master_dataset = []
+    cache = LLMCache(refresh=refresh_cache)
+    journal_path = os.path.join(OUTPUT_DIR, JOURNAL_FILE)
+    journal = read_journal(journal_path)
+    wanted = "failed" if retry_failed else "new"
+    semaphore = asyncio.Semaphore(MAX_IN_FLIGHT)
+    connector = aiohttp.TCPConnector(limit=MAX_IN_FLIGHT)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    start = time.perf_counter()
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+    queued = set()
     
-    md_files = [f for f in os.listdir(SPLIT_FILES_DIR) 
-                if f.endswith('.md') and os.path.isfile(os.path.join(SPLIT_FILES_DIR, f))]
+    with open_journal(journal_path) as journal_file:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            # Requests run concurrently but results are collected in chunk order;
+            # at most 2 * MAX_IN_FLIGHT chunks are pending so the store is still streamed
+            pending = deque()
+            with tqdm(desc="Processing Chunks") as progress:
+                for chunk in iter_chunks(CHUNK_STORE_PATH):
+                    filename = chunk["file"]
+                    content = chunk["text"].strip()
+                    if not content:
+                        print(f"Empty chunk: {filename}")
+                        continue
+                    digest = chunk.get("chunk_hash") or chunk_hash(chunk["text"])
+                    if digest in queued or chunk_state(journal.get(digest)) != wanted:
+                        counts["skipped"] += 1
+                        continue
+                    queued.add(digest)
+                    task = asyncio.create_task(generate_qa_pairs_async(session, semaphore, content, cache=cache))
+                    pending.append((filename, digest, task))
+                    while len(pending) >= 2 * MAX_IN_FLIGHT or (pending and pending[0][2].done()):
+                        filename, digest, task = pending.popleft()
+                        counts[collect_result(filename, digest, await task, journal_file)] += 1
+                        progress.update()
+                while pending:
+                    filename, digest, task = pending.popleft()
+                    counts[collect_result(filename, digest, await task, journal_file)] += 1
+                    progress.update()
+        os.fsync(journal_file.fileno())
     
-    for filename in tqdm(sorted(md_files), desc="Processing Documents"):
-        file_path = os.path.join(SPLIT_FILES_DIR, filename)
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                
-            if not content:
-                print(f"Empty file: {filename}")
-                continue
-                
-            qa_data = generate_qa_pairs(content)
-            if not qa_data:
-                print(f"No valid QA pairs in {filename}")
-                continue
-                
-            # Save individual file QA
-            output_file = os.path.join(OUTPUT_DIR, f"{os.path.splitext(filename)[0]}_qa.json")
-            save_to_file({"source": filename, "qa_pairs": qa_data}, output_file)
-            
-            # Aggregate for master file
-            master_dataset.extend(qa_data)
-            
-        except Exception as e:
-            print(f"Processing Error [{filename}]: {str(e)}")
-            continue
+    elapsed = time.perf_counter() - start
+    n_chunks = counts["done"] + counts["failed"]
+    print(f"Processed {n_chunks} chunks in {elapsed:.1f} s ({n_chunks / max(elapsed, 1e-9):.2f} chunks/s, "
+          f"up to {MAX_IN_FLIGHT} requests in flight): {counts['done']} done, {counts['failed']} failed, "
+          f"{counts['skipped']} skipped")
+    cache_stats = cache.stats()
+    cache.close()
+    print(f"Cache: {cache_stats['hits']} hits / {cache_stats['hits'] + cache_stats['misses']} lookups "
+          f"({cache_stats['hit_rate']:.1%}), {cache_stats['entries']} entries, {cache_stats['mb']:.1f} MB")
+    remaining = sum(entry["status"] == "failed" for entry in read_journal(journal_path).values())
+    if remaining:
+        print(f"{remaining} chunks failed; re-run with --retry-failed to retry them")
     
     # Save consolidated dataset
-    if master_dataset:
-        save_to_file(master_dataset, os.path.join(OUTPUT_DIR, ALL_QA_OUTPUT_FILE))
+    output_path = os.path.join(OUTPUT_DIR, ALL_QA_OUTPUT_FILE)
+    count = build_master_dataset(journal_path, output_path)
+    if count:
+        print(f"Saved {count} items to {output_path}")
     else:
         print("Warning: No QA pairs generated from any files")
 
+def process_files(retry_failed=False, refresh_cache=False):
+    asyncio.run(process_files_async(retry_failed, refresh_cache))
+
 if __name__ == "__main__":
-    process_files()
+    parser = argparse.ArgumentParser(description="Generate a QA dataset from the chunk store via an OpenAI-compatible API")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="only retry chunks whose last attempt failed (by default only new chunks are processed)")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="ignore cached completions and call the model again (new results are still cached)")
+    args = parser.parse_args()
+    process_files(args.retry_failed, args.refresh_cache)
@@ -1,13 +1,19 @@
 import os
 import json
+import time
 from vllm import LLM, SamplingParams
+from chunk_store import iter_chunks
+from enhanced_markdown_splitter import batched
+from llm_cache import LLMCache, cache_key, model_identity
 
 
 # 配置参数
 LOCAL_MODEL_PATH = "your_local_model_path"  # 替换为你的本地模型路径
-SPLIT_FILES_DIR = "split_markdown_docs"  # 切分后文件所在的文件夹
+CHUNK_STORE_PATH = os.path.join("split_markdown_docs", "chunks_dedup.jsonl")  # chunk_dedup.py去重后的切片库（JSONL或Parquet）
 OUTPUT_DIR = "qa_pairs_output"  # 保存问答对的文件夹
 NUM_QUESTIONS_PER_FILE = 3  # 每个文件生成的问答对数量
+BATCH_SIZE = 512  # 每次generate提交的切片数，vLLM在一批内部做连续批处理，批越大GPU越满
+REFRESH_CACHE = False  # 为True时不读取提示/补全缓存，全部重新生成（结果仍写入缓存）
 SAMPLING_PARAMS = SamplingParams(
     temperature=0.7,
     top_p=0.9,
@@ -15,16 +21,50 @@ SAMPLING_PARAMS = SamplingParams(
 )
 
 
-def generate_qa_pairs(text):
+_llm = None  # 整个进程共用一个vLLM引擎，模型权重只加载一次
+_load_seconds = 0.0
+_cache = None
+_model_id = None
+
+
+def get_llm():
     """
-    根据输入文本生成问答对
-    :param text: 输入的文本内容
-    :return: 生成的问答对列表
+    返回共用的vLLM引擎，第一次调用时加载模型（全部命中缓存时不加载）
+    """
+    global _llm, _load_seconds
+    if _llm is None:
+        load_start = time.perf_counter()
+        _llm = LLM(model=LOCAL_MODEL_PATH)
+        _load_seconds = time.perf_counter() - load_start
+        print(f"模型加载耗时 {_load_seconds:.1f} 秒")
+    return _llm
+
+
+def get_cache():
+    """
+    返回与vllm_api_qa_dataset_generation共用的提示/补全缓存
+    """
+    global _cache
+    if _cache is None:
+        _cache = LLMCache(refresh=REFRESH_CACHE)
+    return _cache
+
+
+def get_model_id():
+    """
+    缓存键中的模型标识：包含配置和权重文件的指纹，同一路径下替换权重后不会命中旧的补全
     """
-    llm = LLM(model=LOCAL_MODEL_PATH)
-    prompt = f"请根据以下文本生成{NUM_QUESTIONS_PER_FILE}个问答对，以JSON数组形式输出，每个元素包含'question'和'answer'字段：\n{text}"
-    outputs = llm.generate(prompts=[prompt], sampling_params=SAMPLING_PARAMS)
-    generated_text = outputs[0].outputs[0].text
+    global _model_id
+    if _model_id is None:
+        _model_id = model_identity(LOCAL_MODEL_PATH)
+    return _model_id
+
+
+def build_prompt(text):
+    return f"请根据以下文本生成{NUM_QUESTIONS_PER_FILE}个问答对，以JSON数组形式输出，每个元素包含'question'和'answer'字段：\n{text}"
+
+
+def parse_qa_pairs(generated_text):
     try:
         qa_pairs = json.loads(generated_text)
         return qa_pairs
@@ -33,23 +73,70 @@ def generate_qa_pairs(text):
         return []
 
 
+def generate_qa_batch(texts):
+    """
+    把一批文本中未命中缓存的提示一次提交给vLLM引擎，生成问答对
+    只缓存能解析出问答对的补全；缓存中无法解析的补全视为未命中，重新生成
+    :param texts: 输入的文本列表
+    :return: (每段文本的问答对列表, 输入token数, 生成token数)，token数只统计实际生成的部分
+    """
+    prompts = [build_prompt(text) for text in texts]
+    keys = [cache_key(get_model_id(), prompt, SAMPLING_PARAMS.temperature, SAMPLING_PARAMS.top_p,
+                      SAMPLING_PARAMS.max_tokens, SAMPLING_PARAMS.seed) for prompt in prompts]
+    results = {key: parse_qa_pairs(completion) for key, completion in get_cache().get_many(keys).items()}
+    missing = [i for i, key in enumerate(keys) if not results.get(key)]
+    prompt_tokens = generated_tokens = 0
+    if missing:
+        outputs = get_llm().generate(prompts=[prompts[i] for i in missing], sampling_params=SAMPLING_PARAMS)
+        generated = {}
+        for i, output in zip(missing, outputs):
+            results[keys[i]] = parse_qa_pairs(output.outputs[0].text)
+            if results[keys[i]]:
+                generated[keys[i]] = output.outputs[0].text
+        get_cache().put_many(generated, get_model_id())
+        prompt_tokens = sum(len(output.prompt_token_ids) for output in outputs)
+        generated_tokens = sum(len(output.outputs[0].token_ids) for output in outputs)
+    return [results[key] for key in keys], prompt_tokens, generated_tokens
+
+
+def generate_qa_pairs(text):
+    """
+    根据输入文本生成问答对
+    :param text: 输入的文本内容
+    :return: 生成的问答对列表
+    """
+    return generate_qa_batch([text])[0][0]
+
+
 def process_files():
     """
-    处理切分后的文件，生成问答对并保存
+    流式读取切片库中的切片，每BATCH_SIZE个切片批量生成问答对并保存，最后输出吞吐量
     """
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
-    for filename in os.listdir(SPLIT_FILES_DIR):
-        if filename.endswith('.md'):
-            file_path = os.path.join(SPLIT_FILES_DIR, filename)
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            qa_pairs = generate_qa_pairs(content)
-            output_filename = os.path.splitext(filename)[0] + '_qa.json'
+    loaded_before = _llm is not None
+    start = time.perf_counter()
+    n_chunks = prompt_tokens = generated_tokens = 0
+    for chunks in batched(iter_chunks(CHUNK_STORE_PATH), BATCH_SIZE):
+        results, n_prompt, n_generated = generate_qa_batch([chunk["text"] for chunk in chunks])
+        for chunk, qa_pairs in zip(chunks, results):
+            output_filename = os.path.splitext(chunk["file"])[0] + '_qa.json'
             output_path = os.path.join(OUTPUT_DIR, output_filename)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
             with open(output_path, 'w', encoding='utf-8') as output_file:
                 json.dump(qa_pairs, output_file, ensure_ascii=False, indent=4)
-            print(f"为 {filename} 生成的问答对已保存到 {output_path}")
+        n_chunks += len(chunks)
+        prompt_tokens += n_prompt
+        generated_tokens += n_generated
+        print(f"已为 {n_chunks} 个切片生成问答对")
+
+    # 只扣除本次调用期间发生的模型加载时间
+    elapsed = time.perf_counter() - start - (0.0 if loaded_before else _load_seconds)
+    print(f"共 {n_chunks} 个切片，生成耗时 {elapsed:.1f} 秒：{n_chunks / max(elapsed, 1e-9):.2f} 切片/秒，"
+          f"输入 {prompt_tokens / max(elapsed, 1e-9):.0f} token/秒，生成 {generated_tokens / max(elapsed, 1e-9):.0f} token/秒")
+    cache_stats = get_cache().stats()
+    print(f"缓存命中 {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']}（{cache_stats['hit_rate']:.1%}），"
+          f"缓存共 {cache_stats['entries']} 条，{cache_stats['mb']:.1f} MB")
 
 
 if __name__ == "__main__":